@@ -1,23 +1,44 @@
 import os
+import sys
 import csv
 import requests
 import base64
 import io
-from typing import List, Dict, Optional
-from datetime import datetime
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form
+import re
+import json
+import time
+import heapq
+import bisect
+import hashlib
+import unicodedata
+from array import array
+from typing import List, Dict, Optional, Callable, Iterator
+from datetime import datetime, timedelta
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from pymongo import MongoClient
-from pymongo.errors import DuplicateKeyError
+from pymongo import MongoClient, ReturnDocument, UpdateOne, ReplaceOne, DeleteOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 import uuid
+import zlib
+import zipfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import random
+from collections import OrderedDict
 from PIL import Image
 import pandas as pd
 import openpyxl
 from pathlib import Path
 from dotenv import load_dotenv
 
+try:
+    import zstandard
+except ImportError:  # zlib is used for hierarchy structures when zstd is unavailable
+    zstandard = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -39,14 +60,31 @@ try:
     client = MongoClient(MONGO_URL)
     db = client[DB_NAME]
     employees_collection = db.employees
-    images_collection = db.employee_images
+    images_collection = db.employee_images  # emp_code -> image_hash of the employee's photo
+    image_blobs_collection = db.image_blobs  # Content-addressed photos keyed by SHA-256, reference counted
     hierarchies_collection = db.hierarchies  # New collection for saving hierarchies
+    hierarchy_revisions_collection = db.hierarchy_revisions  # Snapshots and diffs of hierarchy history
+    attendance_days_collection = db.attendance_days  # One document of bit-packed statuses per day
+    attendance_slots_collection = db.attendance_slots  # Stable emp_code -> bit position in the day documents
+    attendance_rollups_collection = db.attendance_rollups  # Status counts per (period, department, location)
+    image_import_jobs_collection = db.image_import_jobs  # Progress of bulk photo imports, expired by a TTL index
+    image_import_results_collection = db.image_import_results  # Per-file reports of bulk photo imports
+    counters_collection = db.counters
     print(f"✅ Connected to MongoDB: {DB_NAME}")
 except Exception as e:
     print(f"❌ MongoDB connection failed: {e}")
     client = None
     db = None
+    images_collection = None
+    image_blobs_collection = None
     hierarchies_collection = None
+    hierarchy_revisions_collection = None
+    attendance_days_collection = None
+    attendance_slots_collection = None
+    attendance_rollups_collection = None
+    image_import_jobs_collection = None
+    image_import_results_collection = None
+    counters_collection = None
 
 # Configuration for Excel data source only
 EXCEL_FILE_PATH = os.environ.get('EXCEL_FILE_PATH', '/app/EMPLOPYEE DIR.xlsx')
@@ -54,6 +92,87 @@ EXCEL_FILE_PATH = os.environ.get('EXCEL_FILE_PATH', '/app/EMPLOPYEE DIR.xlsx')
 # In-memory storage for employee data
 employees_data = []
 
+# Content hash of the currently loaded employee snapshot
+dataset_version = ""
+
+# Image revision shared by all workers through counters_collection, since read responses embed image URLs
+IMAGES_VERSION_TTL_SECONDS = float(os.environ.get('IMAGES_VERSION_TTL_SECONDS', '1'))
+IMAGES_VERSION_RETRY_SECONDS = 60  # Back-off after MongoDB could not be read
+images_version = 0
+images_version_checked_at = 0.0
+
+# Name search indexes, rebuilt together with every employee snapshot
+name_token_tree = None  # BKTree over emp_name tokens
+name_token_rows = {}  # token -> rows of employees_data containing it
+name_tokens_sorted = []  # all tokens, sorted for prefix lookups
+name_phonetic_rows = {}  # phonetic key -> rows with a name token of that key
+
+# Normalized (NFKC + casefold) shadow values, rebuilt together with every employee snapshot
+search_rows = []  # per row of employees_data: {field: normalized value}
+search_haystack = ""  # every row's normalized fields, each followed by SEARCH_FIELD_SEPARATOR
+search_row_starts = []  # offset of each row in search_haystack
+search_field_starts = []  # per row: offset of each SEARCH_HAYSTACK_FIELDS value in search_haystack
+
+# Reporting-line tree derived from reporting_id, rebuilt together with every employee snapshot
+employee_rows = {}  # emp_code -> row of employees_data
+org_parent = []  # row -> manager row, -1 for roots
+org_children = []  # row -> direct report rows, ordered by name
+org_roots = []  # rows without a (known) manager, ordered by name
+org_depth = []  # row -> distance from its root
+org_preorder = []  # rows in pre-order; each subtree is a contiguous slice
+org_tin = []  # row -> position in org_preorder
+org_tout = []  # row -> position just past its last descendant in org_preorder
+org_up = []  # binary lifting table: org_up[k][row] is the 2^k-th manager (roots point to themselves)
+reporting_validation = {}  # orphans, self-reports, cycles and depth distribution of the last load
+
+# Progress of the background audit of saved hierarchies that follows every data reload
+hierarchy_audit_status = {"state": "idle"}
+
+ATTENDANCE_STATUSES = ["Present", "Late", "Half Day", "Absent"]
+
+# Attendance generated for the current day, keyed by (emp_code, date); cleared when the date rolls over
+attendance_cache = {}
+attendance_cache_date = ""
+attendance_cache_stats = {"hits": 0, "misses": 0}
+
+# Recorded attendance: each employee owns a stable slot (bit position) in the per-day documents
+ATTENDANCE_STATUS_FIELDS = {"Present": "present", "Late": "late", "Half Day": "half_day", "Absent": "absent"}
+ATTENDANCE_NO_TIME = 0xFFFF  # check_in/check_out minute offset meaning "not recorded"
+ATTENDANCE_NO_GROUP = 0xFFFF  # slot_groups entry of a slot with nothing recorded
+ATTENDANCE_WRITE_RETRIES = 5
+ATTENDANCE_RANGE_MAX_DAYS = 366
+ATTENDANCE_ROLLUP_PERIODS = ["day", "week", "month"]
+ATTENDANCE_STORE_RETRY_SECONDS = 60  # Reads skip the store this long after a failed MongoDB call
+ATTENDANCE_SLOTS_TTL_SECONDS = float(os.environ.get('ATTENDANCE_SLOTS_TTL_SECONDS', '1'))  # How often reads look up slots other workers assigned
+attendance_slots = {}  # emp_code -> slot
+attendance_slots_checked_at = 0.0
+attendance_store_failed_at = 0.0
+ATTENDANCE_DAY_CACHE_SIZE = int(os.environ.get('ATTENDANCE_DAY_CACHE_SIZE', '8'))  # Decoded days kept besides today
+attendance_day_cache = OrderedDict()  # date -> decoded day document, least recently used first
+attendance_lock = threading.Lock()
+
+# Read endpoints are always revalidated by clients through If-None-Match
+READ_CACHE_CONTROL = os.environ.get('READ_CACHE_CONTROL', 'private, no-cache')
+
+# Number of employees enriched per image query when streaming the directory
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', '500'))
+
+# Time budget and result size for fuzzy name search (search-as-you-type)
+FUZZY_SEARCH_BUDGET_MS = float(os.environ.get('FUZZY_SEARCH_BUDGET_MS', '50'))
+SEARCH_DEFAULT_LIMIT = int(os.environ.get('SEARCH_DEFAULT_LIMIT', '50'))
+
+# Hierarchy structures whose JSON exceeds this many bytes are stored compressed
+HIERARCHY_COMPRESSION_THRESHOLD = int(os.environ.get('HIERARCHY_COMPRESSION_THRESHOLD', str(16 * 1024)))
+HIERARCHY_COMPRESSION_CODEC = os.environ.get('HIERARCHY_COMPRESSION_CODEC', 'zstd' if zstandard else 'zlib')
+# PATCH edits to a compressed structure collect in an uncompressed side log until it reaches this size
+HIERARCHY_DELTA_MAX_BYTES = int(os.environ.get('HIERARCHY_DELTA_MAX_BYTES', str(16 * 1024)))
+
+# Revisions between full snapshots in a hierarchy's history; bounds the cost of checkout
+HIERARCHY_SNAPSHOT_INTERVAL = int(os.environ.get('HIERARCHY_SNAPSHOT_INTERVAL', '20'))
+
+# Memory bound for serialized read responses kept by the response cache
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
 # Column mapping for Excel file - updated to match EMPLOPYEE DIR.xlsx structure
 COLUMN_MAPPING = {
     'EMP ID': 'emp_code',
@@ -125,6 +244,32 @@ def validate_image(file_content: bytes, max_size_mb: int = 5) -> tuple[bool, str
     except Exception as e:
         return False, f"Invalid image file: {str(e)}"
 
+def image_content_hash(image_data: str) -> str:
+    """SHA-256 of the decoded image bytes; identifies the blob in image_blobs"""
+    return hashlib.sha256(base64.b64decode(image_data)).hexdigest()
+
+def image_data_url(image_type: str, image_data: str) -> str:
+    """data: URL for a stored image"""
+    return f"data:{image_type};base64,{image_data}"
+
+def get_image_blobs(image_hashes: List[str]) -> Dict[str, Dict]:
+    """Load content-addressed image blobs by hash with a single query"""
+    if image_blobs_collection is None or not image_hashes:
+        return {}
+    return {blob['_id']: blob for blob in image_blobs_collection.find({"_id": {"$in": list(set(image_hashes))}})}
+
+def resolve_image_docs(image_docs: List[Dict]) -> Dict[str, str]:
+    """emp_code -> data URL, reading blobs by hash (images saved before deduplication keep inline data)"""
+    blobs = get_image_blobs([doc['image_hash'] for doc in image_docs if doc.get('image_hash')])
+    images = {}
+    for image_doc in image_docs:
+        blob = blobs.get(image_doc.get('image_hash'))
+        if blob:
+            images[image_doc['emp_code']] = image_data_url(blob['image_type'], blob['image_data'])
+        elif image_doc.get('image_data'):
+            images[image_doc['emp_code']] = image_data_url(image_doc['image_type'], image_doc['image_data'])
+    return images
+
 def get_employee_image_from_db(emp_code: str) -> Optional[str]:
     """Get employee image from MongoDB"""
     if images_collection is None:
@@ -133,31 +278,168 @@ def get_employee_image_from_db(emp_code: str) -> Optional[str]:
     try:
         image_doc = images_collection.find_one({"emp_code": emp_code})
         if image_doc:
-            return f"data:{image_doc['image_type']};base64,{image_doc['image_data']}"
+            return resolve_image_docs([image_doc]).get(emp_code)
         return None
     except Exception as e:
         print(f"Error fetching image for {emp_code}: {e}")
         return None
 
+def get_employee_images_from_db(emp_codes: List[str]) -> Dict[str, str]:
+    """Get images for many employees with one query for references and one for blobs"""
+    if images_collection is None or not emp_codes:
+        return {}
+    
+    try:
+        return resolve_image_docs(list(images_collection.find({"emp_code": {"$in": emp_codes}})))
+    except Exception as e:
+        print(f"Error fetching images for {len(emp_codes)} employees: {e}")
+        return {}
+
+def get_employee_image_hashes(emp_codes: List[str]) -> Dict[str, Optional[str]]:
+    """emp_code -> image hash for the given employees that have an image, without loading image data"""
+    if images_collection is None or not emp_codes:
+        return {}
+    
+    try:
+        return {
+            image_doc['emp_code']: image_doc.get('image_hash')
+            for image_doc in images_collection.find({"emp_code": {"$in": emp_codes}}, {"_id": 0, "emp_code": 1, "image_hash": 1})
+        }
+    except Exception as e:
+        print(f"Error checking images for {len(emp_codes)} employees: {e}")
+        return {}
+
+IMAGE_SAVE_RETRIES = 5  # Attempts per employee when concurrent writers keep replacing the same image
+
+def acquire_image_blobs(blobs: Dict[str, tuple], references: Dict[str, int]):
+    """Store blobs ({hash: (image_data, image_type)}) once each and add references to them"""
+    operations = [
+        UpdateOne(
+            {"_id": image_hash},
+            {
+                "$setOnInsert": {"image_data": image_data, "image_type": image_type, "created_at": datetime.now().isoformat()},
+                "$inc": {"refs": references[image_hash]}
+            },
+            upsert=True
+        )
+        for image_hash, (image_data, image_type) in blobs.items()
+    ]
+    if operations:
+        image_blobs_collection.bulk_write(operations, ordered=False)
+
+def release_image_blobs(references: Dict[str, int]):
+    """Drop references to blobs and delete the ones nobody references any more"""
+    references = {image_hash: count for image_hash, count in references.items() if image_hash and count}
+    if not references:
+        return
+    image_blobs_collection.bulk_write(
+        [UpdateOne({"_id": image_hash}, {"$inc": {"refs": -count}}) for image_hash, count in references.items()],
+        ordered=False
+    )
+    image_blobs_collection.delete_many({"_id": {"$in": list(references)}, "refs": {"$lte": 0}})
+
+def save_employee_images_to_db(images: List[tuple]) -> Dict[str, Optional[str]]:
+    """Point employees at content-addressed blobs: [(emp_code, image_data, image_type)], last one per employee wins
+    
+    Identical photos are stored once; blobs are reference counted and removed with their last reference.
+    All employees are written with one unordered bulk_write, each replace conditional on the document
+    read just before, so the hash released is exactly the one replaced; lost races are re-read and retried.
+    Returns emp_code -> None when saved, or the error message when that employee's write failed.
+    """
+    latest = {emp_code: (image_data, image_type) for emp_code, image_data, image_type in images}
+    if not latest:
+        return {}
+    
+    blobs = {}
+    references = {}
+    hashes = {}
+    for emp_code, (image_data, image_type) in latest.items():
+        image_hash = image_content_hash(image_data)
+        hashes[emp_code] = image_hash
+        blobs[image_hash] = (image_data, image_type)
+        references[image_hash] = references.get(image_hash, 0) + 1
+    
+    # Reference the new blobs before the old ones are released so no blob is ever briefly unreferenced
+    acquire_image_blobs(blobs, references)
+    
+    write_id = uuid.uuid4().hex
+    errors = {}
+    released = {}
+    pending = list(latest)
+    for _ in range(IMAGE_SAVE_RETRIES):
+        current = {
+            doc['emp_code']: doc
+            for doc in images_collection.find({"emp_code": {"$in": pending}}, {"_id": 0, "emp_code": 1, "image_hash": 1, "write_id": 1})
+        }
+        operations = []
+        for emp_code in pending:
+            doc = {
+                "emp_code": emp_code,
+                "image_hash": hashes[emp_code],
+                "image_type": latest[emp_code][1],
+                "uploaded_at": datetime.now().isoformat(),
+                "write_id": write_id,
+                "replaced_write_id": current[emp_code].get("write_id") if emp_code in current else None
+            }
+            if emp_code in current:
+                old = current[emp_code]
+                operations.append(ReplaceOne(
+                    {"emp_code": emp_code, "image_hash": old.get("image_hash"), "write_id": old.get("write_id")},
+                    doc
+                ))
+            else:
+                operations.append(UpdateOne({"emp_code": emp_code}, {"$setOnInsert": doc}, upsert=True))
+        
+        try:
+            outcome = images_collection.bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            outcome = e.details
+        except Exception as e:
+            errors.update({emp_code: str(e) for emp_code in pending})
+            break
+        
+        for write_error in outcome.get('writeErrors', []):
+            errors[pending[write_error['index']]] = write_error.get('errmsg', 'Write failed')
+        written = [emp_code for emp_code in pending if emp_code not in errors]
+        inserts = sum(1 for emp_code in written if emp_code not in current)
+        
+        if outcome.get('nUpserted', 0) == inserts and outcome.get('nMatched', 0) == len(written) - inserts:
+            applied = set(written)
+        else:
+            # Some writes lost a race: ours is applied if it is still there, or if it is what the latest write replaced
+            applied = {
+                doc['emp_code']
+                for doc in images_collection.find({"emp_code": {"$in": written}}, {"_id": 0, "emp_code": 1, "write_id": 1, "replaced_write_id": 1})
+                if write_id in (doc.get("write_id"), doc.get("replaced_write_id"))
+            }
+        
+        for emp_code in applied:
+            old_hash = current.get(emp_code, {}).get("image_hash")
+            if old_hash:
+                released[old_hash] = released.get(old_hash, 0) + 1
+        pending = [emp_code for emp_code in pending if emp_code not in applied and emp_code not in errors]
+        if not pending:
+            break
+    
+    for emp_code in pending:
+        errors.setdefault(emp_code, "Image is being updated concurrently, please retry")
+    for emp_code in errors:
+        released[hashes[emp_code]] = released.get(hashes[emp_code], 0) + 1
+    
+    release_image_blobs(released)
+    return {emp_code: errors.get(emp_code) for emp_code in latest}
+
 def save_employee_image_to_db(emp_code: str, image_data: str, image_type: str) -> bool:
     """Save employee image to MongoDB"""
     if images_collection is None:
         return False
     
     try:
-        image_doc = {
-            "emp_code": emp_code,
-            "image_data": image_data,
-            "image_type": image_type,
-            "uploaded_at": datetime.now().isoformat()
-        }
-        
-        # Use upsert to replace existing image
-        images_collection.replace_one(
-            {"emp_code": emp_code}, 
-            image_doc, 
-            upsert=True
-        )
+        error = save_employee_images_to_db([(emp_code, image_data, image_type)])[emp_code]
+        if error:
+            print(f"Error saving image for {emp_code}: {error}")
+            return False
+        bump_images_version()
         return True
     except Exception as e:
         print(f"Error saving image for {emp_code}: {e}")
@@ -169,16 +451,587 @@ def delete_employee_image_from_db(emp_code: str) -> bool:
         return False
     
     try:
-        result = images_collection.delete_one({"emp_code": emp_code})
-        return result.deleted_count > 0
+        image_doc = images_collection.find_one_and_delete({"emp_code": emp_code}, {"image_hash": 1})
+        if image_doc is None:
+            return False
+        if image_doc.get('image_hash'):
+            release_image_blobs({image_doc['image_hash']: 1})
+        bump_images_version()
+        return True
     except Exception as e:
         print(f"Error deleting image for {emp_code}: {e}")
         return False
 
+def migrate_inline_images():
+    """Move images saved with inline data into the content-addressed blob store"""
+    for image_doc in images_collection.find({"image_data": {"$exists": True}}):
+        image_hash = image_content_hash(image_doc['image_data'])
+        acquire_image_blobs({image_hash: (image_doc['image_data'], image_doc['image_type'])}, {image_hash: 1})
+        result = images_collection.update_one(
+            {"_id": image_doc['_id'], "image_data": {"$exists": True}},
+            {"$set": {"image_hash": image_hash}, "$unset": {"image_data": ""}}
+        )
+        if result.modified_count == 0:
+            release_image_blobs({image_hash: 1})  # Replaced or deleted concurrently
+
+def bump_images_version():
+    """Invalidate cached read responses (in every worker) after an image change"""
+    global images_version, images_version_checked_at
+    try:
+        counter = counters_collection.find_one_and_update(
+            {"_id": "images_version"},
+            {"$inc": {"value": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        images_version = counter["value"]
+        images_version_checked_at = time.time()
+    except Exception as e:
+        print(f"Error bumping images version: {e}")
+        images_version += 1
+
+def current_images_version() -> int:
+    """Image revision from MongoDB, re-read at most every IMAGES_VERSION_TTL_SECONDS"""
+    global images_version, images_version_checked_at
+    if counters_collection is None or time.time() - images_version_checked_at < IMAGES_VERSION_TTL_SECONDS:
+        return images_version
+    
+    try:
+        counter = counters_collection.find_one({"_id": "images_version"})
+        images_version = counter["value"] if counter else 0
+        images_version_checked_at = time.time()
+    except Exception as e:
+        print(f"Error reading images version: {e}")
+        images_version_checked_at = time.time() + IMAGES_VERSION_RETRY_SECONDS
+    return images_version
+
+def tokenize_name(name: str) -> List[str]:
+    """Split a name into lower-cased alphanumeric tokens"""
+    return re.findall(r"[a-z0-9]+", name.lower())
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance between two tokens"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb)
+            ))
+        previous = current
+    return previous[-1]
+
+def fuzzy_max_distance(token: str) -> int:
+    """Edit distance tolerated for a query token of this length"""
+    if len(token) <= 2:
+        return 0
+    if len(token) <= 5:
+        return 1
+    return 2
+
+class BKTree:
+    """Burkhard-Keller tree over name tokens for bounded edit-distance lookups"""
+    
+    def __init__(self):
+        # Each node is (token, {distance: child_node})
+        self.root = None
+        self.size = 0
+    
+    def add(self, token: str):
+        if self.root is None:
+            self.root = (token, {})
+            self.size = 1
+            return
+        
+        node = self.root
+        while True:
+            distance = edit_distance(token, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (token, {})
+                self.size += 1
+                return
+            node = child
+    
+    def search(self, token: str, max_distance: int, deadline: Optional[float] = None) -> List[tuple]:
+        """Return (distance, token) pairs within max_distance, stopping early past the deadline"""
+        if self.root is None:
+            return []
+        
+        matches = []
+        stack = [self.root]
+        while stack:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            candidate, children = stack.pop()
+            distance = edit_distance(token, candidate)
+            if distance <= max_distance:
+                matches.append((distance, candidate))
+            # Triangle inequality: only subtrees at distance d +/- max_distance can match
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return matches
+
+# Spelling variants common in romanized Indian names, applied in order
+PHONETIC_REPLACEMENTS = [
+    ('ph', 'f'),
+    ('ch', 'C'),  # kept distinct from k so that Chauhan and Khan do not collide
+    ('sh', 's'),
+    ('x', 'ks'),
+    ('q', 'k'),
+    ('ck', 'k'),
+    ('c', 'k'),
+    ('z', 'j'),
+    ('w', 'v')
+]
+
+def phonetic_key(token: str) -> str:
+    """Phonetic key for a romanized Indian name token
+    
+    Folds common spelling variants (x/ks, w/v, z/j), drops aspiration (kh, bh, th...),
+    drops non-leading vowels and collapses doubled consonants, so that e.g.
+    Chauhan/Chouhan, Saxena/Saksena and Malhotra/Malhautra share a key.
+    """
+    token = re.sub(r"[^a-z]", "", token.lower())
+    if not token:
+        return ""
+    
+    for source, target in PHONETIC_REPLACEMENTS:
+        token = token.replace(source, target)
+    token = re.sub(r"([bdgjkpt])h", r"\1", token)
+    
+    first = 'A' if token[0] in 'aeiouy' else token[0]
+    key = first + re.sub(r"[aeiouyh]", "", token[1:])
+    return re.sub(r"(.)\1+", r"\1", key)
+
+def build_name_search_index(employees: List[Dict]):
+    """Build the BK-tree, token postings and phonetic keys used by name search"""
+    global name_token_tree, name_token_rows, name_tokens_sorted, name_phonetic_rows
+    
+    token_rows = {}
+    for row, emp in enumerate(employees):
+        for token in set(tokenize_name(emp.get('emp_name', ''))):
+            token_rows.setdefault(token, []).append(row)
+    
+    tree = BKTree()
+    phonetic_rows = {}
+    for token, rows in token_rows.items():
+        tree.add(token)
+        key = phonetic_key(token)
+        if key:
+            phonetic_rows.setdefault(key, set()).update(rows)
+    
+    name_token_tree = tree
+    name_token_rows = token_rows
+    name_tokens_sorted = sorted(token_rows)
+    name_phonetic_rows = {key: sorted(rows) for key, rows in phonetic_rows.items()}
+
+def phonetic_search_names(q: str, limit: int) -> List[tuple]:
+    """Rank employees whose name tokens sound like every query token, returning (score, row) pairs
+    
+    Each query token costs one hash probe; exact spellings score above phonetic variants.
+    """
+    query_tokens = tokenize_name(q)
+    if not query_tokens:
+        return []
+    
+    row_scores = None
+    for query_token in query_tokens:
+        rows = name_phonetic_rows.get(phonetic_key(query_token), [])
+        exact_rows = set(name_token_rows.get(query_token, []))
+        token_scores = {row: 1.0 if row in exact_rows else 0.8 for row in rows}
+        
+        if row_scores is None:
+            row_scores = token_scores
+        else:
+            row_scores = {row: row_scores[row] + score for row, score in token_scores.items() if row in row_scores}
+        if not row_scores:
+            return []
+    
+    ranked = heapq.nlargest(limit, row_scores.items(), key=lambda item: (item[1], -item[0]))
+    return [(round(score / len(query_tokens), 3), row) for row, score in ranked]
+
+def fuzzy_search_names(q: str, limit: int) -> List[tuple]:
+    """Rank employees by name similarity to q, returning (score, row) pairs best first
+    
+    Every query token must match a name token exactly, as a prefix (for the token
+    being typed) or within a length-dependent edit distance.
+    """
+    query_tokens = tokenize_name(q)
+    if not query_tokens or name_token_tree is None:
+        return []
+    
+    deadline = time.perf_counter() + FUZZY_SEARCH_BUDGET_MS / 1000
+    row_scores = None
+    
+    for query_token in query_tokens:
+        token_scores = {}
+        
+        for distance, token in name_token_tree.search(query_token, fuzzy_max_distance(query_token), deadline):
+            token_scores[token] = 1 - distance / max(len(query_token), len(token))
+        
+        # Prefix matches keep results stable while the last token is still being typed
+        start = bisect.bisect_left(name_tokens_sorted, query_token)
+        for token in name_tokens_sorted[start:start + max(limit, 100)]:
+            if not token.startswith(query_token):
+                break
+            token_scores[token] = max(token_scores.get(token, 0), 0.9 if token != query_token else 1.0)
+        
+        best_by_row = {}
+        for token, score in token_scores.items():
+            for row in name_token_rows[token]:
+                if score > best_by_row.get(row, 0):
+                    best_by_row[row] = score
+        
+        if row_scores is None:
+            row_scores = best_by_row
+        else:
+            row_scores = {row: row_scores[row] + score for row, score in best_by_row.items() if row in row_scores}
+        if not row_scores:
+            return []
+    
+    ranked = heapq.nlargest(limit, row_scores.items(), key=lambda item: (item[1], -item[0]))
+    return [(round(score / len(query_tokens), 3), row) for row, score in ranked]
+
+# Field order of the global search haystack; the separator never occurs in normalized queries
+SEARCH_HAYSTACK_FIELDS = list(COLUMN_MAPPING.values())
+SEARCH_FIELD_SEPARATOR = "\x1f"
+
+def normalize_search_text(value) -> str:
+    """Normalize a value or query for case- and width-insensitive matching"""
+    text = unicodedata.normalize('NFKC', str(value)).casefold()
+    return text.replace(SEARCH_FIELD_SEPARATOR, "")
+
+def build_search_columns(employees: List[Dict]):
+    """Precompute normalized shadow values and the global search haystack"""
+    global search_rows, search_haystack, search_row_starts, search_field_starts
+    
+    rows = []
+    parts = []
+    row_starts = []
+    field_starts = []
+    position = 0
+    for emp in employees:
+        normalized = {field: normalize_search_text(emp.get(field) or "") for field in SEARCH_HAYSTACK_FIELDS}
+        rows.append(normalized)
+        
+        row_starts.append(position)
+        starts = []
+        for field in SEARCH_HAYSTACK_FIELDS:
+            starts.append(position)
+            parts.append(normalized[field])
+            parts.append(SEARCH_FIELD_SEPARATOR)
+            position += len(normalized[field]) + 1
+        field_starts.append(starts)
+    
+    search_rows = rows
+    search_haystack = "".join(parts)
+    search_row_starts = row_starts
+    search_field_starts = field_starts
+
+def normalize_emp_code(value) -> str:
+    """Canonical employee code; numeric Excel cells can arrive as e.g. '80006.0'"""
+    code = str(value or "").strip()
+    if code.endswith('.0') and code[:-2].isdigit():
+        code = code[:-2]
+    return code
+
+# Number of offending employees or cycles listed per category in the validation report
+REPORTING_VALIDATION_SAMPLE = 100
+
+def build_org_index(employees: List[Dict]):
+    """Build and validate the reporting tree with an Euler-tour (pre/post order) numbering
+    
+    Runs in O(N) without recursion. Dangling and self references become roots and
+    cycles are cut, all of which is reported in reporting_validation.
+    """
+    global employee_rows, org_parent, org_children, org_roots, org_depth, org_preorder, org_tin, org_tout
+    global reporting_validation
+    
+    count = len(employees)
+    rows = {}
+    duplicates = []
+    for row, emp in enumerate(employees):
+        code = normalize_emp_code(emp.get('emp_code'))
+        if code in rows:
+            duplicates.append(code)
+        else:
+            rows[code] = row
+    
+    parent = [-1] * count
+    orphans = []
+    self_reports = []
+    for row, emp in enumerate(employees):
+        reporting_id = normalize_emp_code(emp.get('reporting_id'))
+        if not reporting_id:
+            continue
+        manager = rows.get(reporting_id)
+        if manager is None:
+            orphans.append({"emp_code": emp.get('emp_code'), "reporting_id": reporting_id})
+        elif manager == row:
+            self_reports.append(emp.get('emp_code'))
+        else:
+            parent[row] = manager
+    
+    # Rows caught in a reporting cycle are never reached from a root; walk up from every
+    # row with colour marking and cut a cycle where the walk meets itself
+    cycles = []
+    state = [0] * count  # 0 = unvisited, 1 = on the current walk, 2 = done
+    for start in range(count):
+        path = []
+        node = start
+        while node != -1 and state[node] == 0:
+            state[node] = 1
+            path.append(node)
+            node = parent[node]
+        if node != -1 and state[node] == 1:
+            cycles.append([employees[member].get('emp_code') for member in path[path.index(node):]])
+            parent[node] = -1
+        for visited in path:
+            state[visited] = 2
+    
+    children = [[] for _ in range(count)]
+    roots = []
+    for row in range(count):
+        if parent[row] == -1:
+            roots.append(row)
+        else:
+            children[parent[row]].append(row)
+    by_name = lambda row: (employees[row].get('emp_name', ''), row)
+    roots.sort(key=by_name)
+    for child_rows in children:
+        child_rows.sort(key=by_name)
+    
+    depth = [0] * count
+    preorder = []
+    tin = [0] * count
+    tout = [0] * count
+    stack = [(root, False) for root in reversed(roots)]
+    while stack:
+        row, finished = stack.pop()
+        if finished:
+            tout[row] = len(preorder)
+            continue
+        tin[row] = len(preorder)
+        preorder.append(row)
+        stack.append((row, True))
+        for child in reversed(children[row]):
+            depth[child] = depth[row] + 1
+            stack.append((child, False))
+    
+    depth_distribution = {}
+    for row_depth in depth:
+        depth_distribution[row_depth] = depth_distribution.get(row_depth, 0) + 1
+    
+    reporting_validation = {
+        "employees": count,
+        "roots": len(roots),
+        "max_depth": max(depth, default=0),
+        "depth_distribution": {str(level): depth_distribution[level] for level in sorted(depth_distribution)},
+        "orphan_count": len(orphans),
+        "orphans": orphans[:REPORTING_VALIDATION_SAMPLE],
+        "self_report_count": len(self_reports),
+        "self_reports": self_reports[:REPORTING_VALIDATION_SAMPLE],
+        "cycle_count": len(cycles),
+        "cycles": cycles[:REPORTING_VALIDATION_SAMPLE],
+        "duplicate_code_count": len(duplicates),
+        "duplicate_codes": duplicates[:REPORTING_VALIDATION_SAMPLE]
+    }
+    
+    employee_rows = rows
+    org_parent = parent
+    org_children = children
+    org_roots = roots
+    org_depth = depth
+    org_preorder = preorder
+    org_tin = tin
+    org_tout = tout
+
+def build_org_ancestor_table(parent: List[int], depth: List[int]):
+    """Build the binary lifting table used for lowest-common-manager queries"""
+    global org_up
+    
+    count = len(parent)
+    up = [[row if manager == -1 else manager for row, manager in enumerate(parent)]]
+    for _ in range(1, max(depth, default=0).bit_length()):
+        previous = up[-1]
+        up.append([previous[previous[row]] for row in range(count)])
+    
+    org_up = up
+
+def lowest_common_manager(a: int, b: int) -> int:
+    """Row of the lowest common manager of two rows (possibly one of them), -1 if in different trees"""
+    if org_depth[a] < org_depth[b]:
+        a, b = b, a
+    
+    # Lift the deeper row to the same depth, one power of two per set bit
+    difference = org_depth[a] - org_depth[b]
+    level = 0
+    while difference:
+        if difference & 1:
+            a = org_up[level][a]
+        difference >>= 1
+        level += 1
+    if a == b:
+        return a
+    
+    for level in reversed(range(len(org_up))):
+        if org_up[level][a] != org_up[level][b]:
+            a = org_up[level][a]
+            b = org_up[level][b]
+    
+    manager = org_up[0][a]
+    if manager != a and manager == org_up[0][b]:
+        return manager
+    return -1
+
+def set_employees_data(employees: List[Dict]):
+    """Swap in a new employee snapshot and stamp it with a content version"""
+    global employees_data, dataset_version
+    
+    payload = json.dumps(employees, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    build_name_search_index(employees)
+    build_search_columns(employees)
+    build_org_index(employees)
+    build_org_ancestor_table(org_parent, org_depth)
+    dataset_version = hashlib.sha256(payload).hexdigest()[:16]
+    employees_data = employees
+    schedule_hierarchy_audit()
+
+class ResponseCache:
+    """LRU cache of serialized JSON bodies, bounded by total size and scoped to one data version"""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def _check_version(self, version: str):
+        # Entries from an older dataset or image version can never be served again
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.total_bytes = 0
+            self.version = version
+    
+    def get(self, key: tuple, version: str) -> Optional[bytes]:
+        self._check_version(version)
+        body = self.entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return body
+    
+    def put(self, key: tuple, version: str, body: bytes):
+        self._check_version(version)
+        if len(body) > self.max_bytes:
+            return
+        
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= len(previous)
+        self.entries[key] = body
+        self.total_bytes += len(body)
+        
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+            self.evictions += 1
+    
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "version": self.version
+        }
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES)
+
+def serialize_json(payload) -> bytes:
+    """Serialize a payload exactly like JSONResponse does"""
+    return json.dumps(
+        payload,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+def get_read_etag() -> str:
+    """ETag shared by all read endpoints for the current dataset and image state"""
+    return f'"{dataset_version}-{current_images_version()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def conditional_read_response(
+    request: Request,
+    build_payload: Callable[[], Dict],
+    cache_params: Optional[Dict] = None,
+    etag_scope: str = ""
+) -> Response:
+    """Answer 304 when the client already has the current version, otherwise serve cached or freshly built bytes
+    
+    cache_params are the endpoint's normalized query parameters; by default the raw query string is used.
+    etag_scope versions responses that also depend on data outside the employee snapshot.
+    """
+    version = get_read_etag()
+    etag = f'{version[:-1]}-{etag_scope}"' if etag_scope else version
+    headers = {"ETag": etag, "Cache-Control": READ_CACHE_CONTROL, "Vary": "Accept"}
+    
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        response_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    
+    if cache_params is None:
+        cache_params = dict(request.query_params)
+    key = (request.url.path, tuple(sorted((k, v) for k, v in cache_params.items() if v)), etag_scope)
+    
+    body = response_cache.get(key, version)
+    if body is None:
+        body = serialize_json(build_payload())
+        response_cache.put(key, version, body)
+    
+    return Response(content=body, media_type="application/json", headers=headers)
+
 def fetch_excel_data(file_path: str = None):
     """Fetch employee data from Excel file"""
-    global employees_data
-    
     if file_path is None:
         file_path = EXCEL_FILE_PATH
     
@@ -194,7 +1047,7 @@ def fetch_excel_data(file_path: str = None):
         print(f"Excel columns found: {df.columns.tolist()}")
         
         # Convert DataFrame to list of dictionaries
-        employees_data = []
+        loaded_employees = []
         
         for _, row in df.iterrows():
             employee = {}
@@ -213,9 +1066,17 @@ def fetch_excel_data(file_path: str = None):
             # Ensure all required fields exist and have valid values
             required_fields = ['emp_code', 'emp_name', 'department', 'location', 'designation', 'mobile']
             if all(field in employee and employee[field] and employee[field] != 'nan' for field in required_fields):
-                employees_data.append(employee)
+                loaded_employees.append(employee)
         
+        set_employees_data(loaded_employees)
         print(f"Successfully loaded {len(employees_data)} employees from Excel file")
+        print(
+            f"Reporting lines: {reporting_validation['roots']} roots, "
+            f"{reporting_validation['orphan_count']} orphans, "
+            f"{reporting_validation['self_report_count']} self-reports, "
+            f"{reporting_validation['cycle_count']} cycles, "
+            f"max depth {reporting_validation['max_depth']}"
+        )
         return True
         
     except Exception as e:
@@ -224,8 +1085,6 @@ def fetch_excel_data(file_path: str = None):
 
 def fetch_employee_data():
     """Fetch employee data from Excel file"""
-    global employees_data
-    
     if fetch_excel_data():
         return
     
@@ -235,8 +1094,7 @@ def fetch_employee_data():
 
 def use_sample_data():
     """Use sample data as fallback"""
-    global employees_data
-    employees_data = [
+    set_employees_data([
         {
             "emp_code": "80002",
             "emp_name": "VIKAS MALHOTRA",
@@ -273,15 +1131,19 @@ def use_sample_data():
             "joining_date": "2021-05-04",
             "reporting_manager": "CFO"
         }
-    ]
+    ])
 
-def generate_today_attendance(emp_code: str, emp_name: str) -> AttendanceRecord:
-    """Generate mock attendance data for today"""
-    today = datetime.now().strftime("%Y-%m-%d")
+def attendance_rng(emp_code: str, date: str) -> random.Random:
+    """Random generator seeded from (emp_code, date) so every worker draws the same attendance"""
+    seed = hashlib.sha256(f"{emp_code}:{date}".encode('utf-8')).digest()
+    return random.Random(int.from_bytes(seed[:8], 'big'))
+
+def generate_attendance(emp_code: str, emp_name: str, today: str) -> AttendanceRecord:
+    """Generate deterministic mock attendance data for an employee on a date"""
+    rng = attendance_rng(emp_code, today)
     
-    # Generate random attendance data
-    statuses = ["Present", "Late", "Half Day", "Absent"]
-    status = random.choice(statuses)
+    # Generate attendance data
+    status = rng.choice(ATTENDANCE_STATUSES)
     
     if status == "Absent":
         return AttendanceRecord(
@@ -295,8 +1157,8 @@ def generate_today_attendance(emp_code: str, emp_name: str) -> AttendanceRecord:
         )
     
     # Generate check-in time
-    check_in_hour = random.randint(8, 10)
-    check_in_min = random.randint(0, 59)
+    check_in_hour = rng.randint(8, 10)
+    check_in_min = rng.randint(0, 59)
     check_in = f"{check_in_hour:02d}:{check_in_min:02d}"
     
     check_out = None
@@ -304,8 +1166,8 @@ def generate_today_attendance(emp_code: str, emp_name: str) -> AttendanceRecord:
     
     if status != "Half Day":
         # Generate check-out time
-        check_out_hour = random.randint(17, 20)
-        check_out_min = random.randint(0, 59)
+        check_out_hour = rng.randint(17, 20)
+        check_out_min = rng.randint(0, 59)
         check_out = f"{check_out_hour:02d}:{check_out_min:02d}"
         
         # Calculate hours worked
@@ -324,217 +1186,1484 @@ def generate_today_attendance(emp_code: str, emp_name: str) -> AttendanceRecord:
         hours_worked=hours_worked
     )
 
-@app.on_event("startup")
-async def startup_event():
-    """Load employee data on startup"""
-    fetch_employee_data()
-
-@app.get("/api/employees")
-async def get_all_employees():
-    """Get all employees with their images"""
-    enriched_employees = []
-    for emp in employees_data:
-        emp_copy = emp.copy()
-        # Add image URL if available
-        image_url = get_employee_image_from_db(emp['emp_code'])
-        if image_url:
-            emp_copy['image_url'] = image_url
-        enriched_employees.append(emp_copy)
+def generate_today_attendance(emp_code: str, emp_name: str) -> AttendanceRecord:
+    """Get today's mock attendance, generated once per (employee, date) and memoized for the day"""
+    global attendance_cache, attendance_cache_date
     
-    return {"employees": enriched_employees}
-
-@app.get("/api/employees/search")
-async def search_employees(q: str = "", field: str = ""):
-    """Enhanced search employees with improved suggestions and filtering"""
-    if not q:
-        # Return all employees and some sample suggestions for the field
-        suggestions = []
-        if field and field in ['emp_code', 'emp_name', 'department', 'location', 'designation', 'mobile', 'extension_number', 'email']:
-            # Get first 10 unique values for suggestions
-            field_values = set()
-            for emp in employees_data:
-                if field in emp and emp[field]:
-                    field_values.add(emp[field])
-            suggestions = sorted(list(field_values))[:10]
-        
-        # Return employees with images
-        enriched_employees = []
-        for emp in employees_data:
-            emp_copy = emp.copy()
-            image_url = get_employee_image_from_db(emp['emp_code'])
-            if image_url:
-                emp_copy['image_url'] = image_url
-            enriched_employees.append(emp_copy)
-        
-        return {"suggestions": suggestions, "employees": enriched_employees}
+    today = datetime.now().strftime("%Y-%m-%d")
+    if today != attendance_cache_date:
+        attendance_cache = {}
+        attendance_cache_date = today
     
-    q = q.lower()
-    suggestions = []
-    matching_employees = []
+    key = (emp_code, today)
+    attendance = attendance_cache.get(key)
+    if attendance is not None and attendance.emp_name == emp_name:
+        attendance_cache_stats["hits"] += 1
+        return attendance
     
-    # Enhanced search with email, extension_number and joining_date included
-    searchable_fields = ['emp_code', 'emp_name', 'department', 'location', 'designation', 'mobile', 'extension_number', 'email']
+    attendance_cache_stats["misses"] += 1
+    attendance = generate_attendance(emp_code, emp_name, today)
+    attendance_cache[key] = attendance
+    return attendance
+
+def load_attendance_slots():
+    """Reload the emp_code -> slot assignments written by any worker"""
+    global attendance_slots
+    if attendance_slots_collection is None:
+        return
+    attendance_slots = {doc['emp_code']: doc['slot'] for doc in attendance_slots_collection.find({}, {"_id": 0, "emp_code": 1, "slot": 1})}
+
+def attendance_store_readable() -> bool:
+    """Whether reads should consult the store: MongoDB is connected and did not just fail"""
+    return (
+        attendance_days_collection is not None
+        and time.time() - attendance_store_failed_at >= ATTENDANCE_STORE_RETRY_SECONDS
+    )
+
+def refresh_attendance_slots(emp_codes: List[str]):
+    """Pick up slots other workers assigned to emp_codes, looking them up at most every ATTENDANCE_SLOTS_TTL_SECONDS"""
+    global attendance_slots_checked_at
+    missing = [code for code in emp_codes if code not in attendance_slots]
+    if not missing or time.time() - attendance_slots_checked_at < ATTENDANCE_SLOTS_TTL_SECONDS:
+        return
     
-    if field and field in searchable_fields:
-        # Special handling for emp_name to provide better context
-        if field == 'emp_name':
-            # For names, we want to show unique combinations to avoid confusion
-            unique_name_combinations = {}
-            for emp in employees_data:
-                if field in emp and emp[field]:
-                    name = emp[field]
-                    if q in name.lower():
-                        # Create a unique identifier that includes more context
-                        key = f"{name} (#{emp['emp_code']})"
-                        if name.lower() not in [combo.split(' (')[0].lower() for combo in unique_name_combinations.keys()]:
-                            # Only add if we haven't seen this exact name before
-                            unique_name_combinations[name] = emp
-                        matching_employees.append(emp)
-            
-            # Provide suggestions as just names but ensure matching is exact
-            field_values = set(unique_name_combinations.keys())
-            starts_with = [val for val in field_values if val.lower().startswith(q)]
-            contains = [val for val in field_values if q in val.lower() and not val.lower().startswith(q)]
-            suggestions = sorted(starts_with) + sorted(contains)
-            suggestions = suggestions[:10]
-        else:
-            # For other fields, use the normal logic
-            field_values = set()
-            for emp in employees_data:
-                if field in emp and emp[field]:
-                    field_values.add(emp[field])
-            
-            # Enhanced suggestions: show both "starts with" and "contains" results
-            starts_with = [val for val in field_values if val.lower().startswith(q)]
-            contains = [val for val in field_values if q in val.lower() and not val.lower().startswith(q)]
-            
-            # Prioritize "starts with" matches, then "contains" matches
-            suggestions = sorted(starts_with) + sorted(contains)
-            suggestions = suggestions[:10]  # Limit to 10 suggestions
-            
-            # Get all employees that match the query
-            for emp in employees_data:
-                if field in emp and emp[field]:
-                    field_value = emp[field].lower()
-                    if q in field_value:
-                        matching_employees.append(emp)
-    else:
-        # Global search across all fields
-        for emp in employees_data:
-            match = False
-            for key, value in emp.items():
-                if value and q in str(value).lower():
-                    match = True
-                    break
-            if match:
-                matching_employees.append(emp)
-    
-    # Add images to matching employees
-    enriched_matching = []
-    for emp in matching_employees:
-        emp_copy = emp.copy()
-        image_url = get_employee_image_from_db(emp['emp_code'])
-        if image_url:
-            emp_copy['image_url'] = image_url
-        enriched_matching.append(emp_copy)
+    attendance_slots_checked_at = time.time()
+    for doc in attendance_slots_collection.find({"emp_code": {"$in": missing}}, {"_id": 0, "emp_code": 1, "slot": 1}):
+        attendance_slots[doc['emp_code']] = doc['slot']
+
+def assign_attendance_slots(emp_codes: List[str]) -> Dict[str, int]:
+    """Slots for the given employees, reserving a contiguous block for the ones seen for the first time"""
+    missing = [code for code in dict.fromkeys(emp_codes) if code not in attendance_slots]
+    if missing:
+        load_attendance_slots()
+        missing = [code for code in missing if code not in attendance_slots]
+    if missing:
+        counter = counters_collection.find_one_and_update(
+            {"_id": "attendance_slot"},
+            {"$inc": {"next": len(missing)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        first_slot = counter["next"] - len(missing)
+        try:
+            attendance_slots_collection.insert_many(
+                [{"emp_code": code, "slot": first_slot + index} for index, code in enumerate(missing)],
+                ordered=False
+            )
+        except BulkWriteError:
+            pass  # Another worker assigned some of these first; its slots win
+        load_attendance_slots()
+    return {code: attendance_slots[code] for code in emp_codes}
+
+def iter_set_bits(bits: int) -> Iterator[int]:
+    """Positions of the set bits of a bitset, lowest first"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+def pack_uint16(values: array) -> bytes:
+    """Serialize a per-slot uint16 array (minute offsets, group indexes) as little-endian"""
+    if sys.byteorder != 'little':
+        values = array('H', values)
+        values.byteswap()
+    return values.tobytes()
+
+def unpack_uint16(data: bytes, size: int) -> array:
+    """Inverse of pack_uint16, padded with 0xFFFF (no time / no group) up to size slots"""
+    values = array('H')
+    values.frombytes(data or b"")
+    if sys.byteorder != 'little':
+        values.byteswap()
+    if len(values) < size:
+        values.extend([ATTENDANCE_NO_TIME] * (size - len(values)))
+    return values
+
+def decode_attendance_day(doc: Optional[Dict], date: str) -> Dict:
+    """Day document -> {"statuses": {status: int bitset}, "check_in"/"check_out": minute arrays, ...}
     
+    slot_groups holds, per slot, the index in groups of the (department, location) the slot's
+    record was counted under when it was written.
+    """
+    doc = doc or {}
+    size = doc.get("slot_count", 0)
     return {
-        "suggestions": suggestions,
-        "employees": enriched_matching
+        "date": date,
+        "revision": doc.get("revision", 0),
+        "slot_count": size,
+        "statuses": {status: int.from_bytes(doc.get(field) or b"", 'little') for status, field in ATTENDANCE_STATUS_FIELDS.items()},
+        "check_in": unpack_uint16(doc.get("check_in"), size),
+        "check_out": unpack_uint16(doc.get("check_out"), size),
+        "groups": [tuple(group) for group in doc.get("groups", [])],
+        "slot_groups": unpack_uint16(doc.get("slot_groups"), size)
     }
 
-@app.get("/api/employees/filter")
-async def filter_employees(
-    emp_code: str = "",
-    emp_name: str = "",
-    department: str = "",
-    location: str = "",
-    designation: str = "",  # Changed from grade to designation
-    mobile: str = "",
-    extension_number: str = "",
-    email: str = ""
-):
-    """Filter employees by multiple criteria (changed grade to designation, added extension_number)"""
-    filtered_employees = employees_data.copy()
-    
-    filters = {
-        'emp_code': emp_code,
-        'emp_name': emp_name,
-        'department': department,
-        'location': location,
-        'designation': designation,  # Changed from grade
-        'mobile': mobile,
-        'extension_number': extension_number,
-        'email': email
+def encode_attendance_day(day: Dict) -> Dict:
+    """Decoded day -> Mongo document with one bitset per status and packed minute arrays"""
+    size = day["slot_count"]
+    doc = {
+        "date": day["date"],
+        "revision": day["revision"],
+        "slot_count": size,
+        "check_in": pack_uint16(day["check_in"]),
+        "check_out": pack_uint16(day["check_out"]),
+        "groups": [list(group) for group in day["groups"]],
+        "slot_groups": pack_uint16(day["slot_groups"]),
+        "updated_at": datetime.now().isoformat()
     }
+    for status, field in ATTENDANCE_STATUS_FIELDS.items():
+        doc[field] = day["statuses"][status].to_bytes((size + 7) // 8, 'little')
+    return doc
+
+def cache_attendance_day(day: Dict):
+    """Keep a decoded day for reuse: today always, plus the ATTENDANCE_DAY_CACHE_SIZE most recently used days"""
+    attendance_day_cache[day["date"]] = day
+    attendance_day_cache.move_to_end(day["date"])
     
-    for field, value in filters.items():
-        if value:
-            filtered_employees = [
-                emp for emp in filtered_employees 
-                if emp.get(field, "").lower() == value.lower()
-            ]
+    today = datetime.now().strftime("%Y-%m-%d")
+    evictable = [date for date in attendance_day_cache if date != today]
+    for date in evictable[:max(0, len(evictable) - ATTENDANCE_DAY_CACHE_SIZE)]:
+        del attendance_day_cache[date]
+
+def load_attendance_day(date: str) -> Dict:
+    """Decoded attendance for a day, reusing the cached copy while its revision is current"""
+    probe = attendance_days_collection.find_one({"date": date}, {"revision": 1})
+    revision = probe.get("revision", 0) if probe else 0
     
-    # Add images to filtered employees
-    enriched_filtered = []
-    for emp in filtered_employees:
-        emp_copy = emp.copy()
-        image_url = get_employee_image_from_db(emp['emp_code'])
-        if image_url:
-            emp_copy['image_url'] = image_url
-        enriched_filtered.append(emp_copy)
+    day = attendance_day_cache.get(date)
+    if day is None or day["revision"] != revision:
+        doc = attendance_days_collection.find_one({"date": date}) if probe else None
+        day = decode_attendance_day(doc, date)
+    cache_attendance_day(day)
+    return day
+
+def slot_attendance_status(day: Dict, slot: int) -> Optional[str]:
+    """Recorded status of a slot on a day, None if nothing was recorded"""
+    bit = 1 << slot
+    for status, bits in day["statuses"].items():
+        if bits & bit:
+            return status
+    return None
+
+def parse_attendance_minutes(value) -> int:
+    """'HH:MM' -> minutes since midnight, ATTENDANCE_NO_TIME when empty"""
+    if not value:
+        return ATTENDANCE_NO_TIME
+    hours, minutes = str(value).split(':')
+    total = int(hours) * 60 + int(minutes)
+    if not 0 <= total < 24 * 60:
+        raise ValueError(f"Invalid time {value}")
+    return total
+
+def format_attendance_minutes(minutes: int) -> Optional[str]:
+    """Minutes since midnight -> 'HH:MM', None when not recorded"""
+    if minutes == ATTENDANCE_NO_TIME:
+        return None
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def record_attendance_day(date: str, entries: List[tuple]) -> Dict:
+    """Write (slot, status, check_in_minutes, check_out_minutes, (department, location)) entries into a day's bitsets
+    
+    Uses the day's revision for optimistic concurrency and retries when another writer wins.
+    """
+    for _ in range(ATTENDANCE_WRITE_RETRIES):
+        with attendance_lock:
+            cached = load_attendance_day(date)
+            size = max([cached["slot_count"]] + [entry[0] + 1 for entry in entries])
+            day = {
+                "date": date,
+                "revision": cached["revision"] + 1,
+                "slot_count": size,
+                "statuses": dict(cached["statuses"]),
+                "check_in": unpack_uint16(pack_uint16(cached["check_in"]), size),
+                "check_out": unpack_uint16(pack_uint16(cached["check_out"]), size),
+                "groups": list(cached["groups"]),
+                "slot_groups": unpack_uint16(pack_uint16(cached["slot_groups"]), size)
+            }
+            group_indexes = {group: index for index, group in enumerate(day["groups"])}
+            
+            for slot, status, check_in, check_out, group in entries:
+                if group not in group_indexes:
+                    group_indexes[group] = len(day["groups"])
+                    day["groups"].append(group)
+                day["slot_groups"][slot] = group_indexes[group]
+                bit = 1 << slot
+                for recorded in day["statuses"]:
+                    day["statuses"][recorded] &= ~bit
+                day["statuses"][status] |= bit
+                day["check_in"][slot] = check_in
+                day["check_out"][slot] = check_out
+            
+            doc = encode_attendance_day(day)
+            try:
+                if cached["revision"] == 0:
+                    attendance_days_collection.insert_one(doc)
+                    written = True
+                else:
+                    result = attendance_days_collection.replace_one({"date": date, "revision": cached["revision"]}, doc)
+                    written = result.matched_count == 1
+            except DuplicateKeyError:
+                written = False
+            
+            if written:
+                cache_attendance_day(day)
+                return day
     
-    return {"employees": enriched_filtered}
+    raise HTTPException(status_code=409, detail=f"Attendance for {date} is being updated concurrently, please retry")
 
-@app.get("/api/employees/{emp_code}/attendance")
-async def get_employee_attendance(emp_code: str):
-    """Get today's attendance for a specific employee"""
-    # Find employee
-    employee = None
-    for emp in employees_data:
-        if emp['emp_code'] == emp_code:
-            employee = emp
-            break
+def attendance_rollup_periods(date: str) -> List[str]:
+    """Rollup period keys a date falls into, e.g. day:2026-10-12, week:2026-W42, month:2026-10"""
+    parsed = datetime.strptime(date, "%Y-%m-%d")
+    iso_year, iso_week, _ = parsed.isocalendar()
+    return [f"day:{date}", f"week:{iso_year}-W{iso_week:02d}", f"month:{date[:7]}"]
+
+def attendance_day_group_counts(day: Dict) -> Dict[tuple, Dict[str, int]]:
+    """Status counts per (department, location) of one day, from its bitsets and slot groups"""
+    counts = {}
+    for status, bits in day["statuses"].items():
+        field = ATTENDANCE_STATUS_FIELDS[status]
+        for slot in iter_set_bits(bits):
+            group_index = day["slot_groups"][slot] if slot < len(day["slot_groups"]) else ATTENDANCE_NO_GROUP
+            group = day["groups"][group_index] if group_index < len(day["groups"]) else ("", "")
+            group_counts = counts.setdefault(group, {"recorded": 0, **{name: 0 for name in ATTENDANCE_STATUS_FIELDS.values()}})
+            group_counts[field] += 1
+            group_counts["recorded"] += 1
+    return counts
+
+def attendance_period_dates(date: str) -> tuple:
+    """All dates of the ISO week and of the month containing date"""
+    parsed = datetime.strptime(date, "%Y-%m-%d")
+    week_start = parsed - timedelta(days=parsed.weekday())
+    week = [(week_start + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(7)]
     
-    if not employee:
-        raise HTTPException(status_code=404, detail="Employee not found")
+    month = []
+    day = parsed.replace(day=1)
+    while day.month == parsed.month:
+        month.append(day.strftime("%Y-%m-%d"))
+        day += timedelta(days=1)
+    return week, month
+
+def sync_attendance_rollups(date: str):
+    """Rebuild the rollups touched by one day from that day's stored bitsets
+    
+    The day's groups are recomputed from the day document and week/month groups are re-summed
+    from their days' rollups, so running it again after a partial failure repairs the totals.
+    The cost is O(records of the day + days in the month x groups), independent of history.
+    """
+    with attendance_lock:
+        day = load_attendance_day(date)
+        counts = attendance_day_group_counts(day)
+        day_period, week_period, month_period = attendance_rollup_periods(date)
+        now = datetime.now().isoformat()
+        
+        existing = {
+            (doc["department"], doc["location"])
+            for doc in attendance_rollups_collection.find({"period": day_period}, {"_id": 0, "department": 1, "location": 1})
+        }
+        affected = existing | set(counts)
+        
+        operations = [
+            UpdateOne(
+                {"period": day_period, "department": department, "location": location},
+                {"$set": {"counts": group_counts, "updated_at": now}},
+                upsert=True
+            )
+            for (department, location), group_counts in counts.items()
+        ]
+        operations += [
+            DeleteOne({"period": day_period, "department": department, "location": location})
+            for department, location in existing - set(counts)
+        ]
+        if operations:
+            attendance_rollups_collection.bulk_write(operations, ordered=False)
+        
+        # Week and month are sums of their days, restricted to the groups this day touched
+        week_dates, month_dates = attendance_period_dates(date)
+        operations = []
+        for period, dates in ((week_period, week_dates), (month_period, month_dates)):
+            totals = {}
+            for doc in attendance_rollups_collection.find(
+                {"period": {"$in": [f"day:{period_date}" for period_date in dates]}},
+                {"_id": 0, "department": 1, "location": 1, "counts": 1}
+            ):
+                group = (doc["department"], doc["location"])
+                if group not in affected:
+                    continue
+                group_totals = totals.setdefault(group, {})
+                for field, value in doc.get("counts", {}).items():
+                    group_totals[field] = group_totals.get(field, 0) + value
+            
+            for department, location in affected:
+                key = {"period": period, "department": department, "location": location}
+                if (department, location) in totals:
+                    operations.append(UpdateOne(key, {"$set": {"counts": totals[(department, location)], "updated_at": now}}, upsert=True))
+                else:
+                    operations.append(DeleteOne(key))
+        if operations:
+            attendance_rollups_collection.bulk_write(operations, ordered=False)
+
+def recorded_attendance(day: Dict, slot: int, emp_code: str, emp_name: str) -> Optional[AttendanceRecord]:
+    """AttendanceRecord for a slot from a stored day, None if nothing was recorded"""
+    status = slot_attendance_status(day, slot)
+    if status is None:
+        return None
+    
+    check_in = day["check_in"][slot] if slot < len(day["check_in"]) else ATTENDANCE_NO_TIME
+    check_out = day["check_out"][slot] if slot < len(day["check_out"]) else ATTENDANCE_NO_TIME
+    if status == "Absent":
+        hours_worked = 0
+    elif check_in != ATTENDANCE_NO_TIME and check_out != ATTENDANCE_NO_TIME:
+        hours_worked = round((check_out - check_in) / 60, 1)
+    else:
+        hours_worked = None
+    
+    return AttendanceRecord(
+        emp_code=emp_code,
+        emp_name=emp_name,
+        date=day["date"],
+        check_in=format_attendance_minutes(check_in) or "",
+        check_out=format_attendance_minutes(check_out),
+        status=status,
+        hours_worked=hours_worked
+    )
+
+def current_attendance(rows: List[int]) -> List[AttendanceRecord]:
+    """Today's attendance for rows of employees_data: recorded where available, otherwise generated"""
+    global attendance_store_failed_at
+    
+    day = None
+    if attendance_store_readable():
+        try:
+            emp_codes = [employees_data[row]['emp_code'] for row in rows]
+            refresh_attendance_slots(emp_codes)
+            if any(code in attendance_slots for code in emp_codes):
+                day = load_attendance_day(datetime.now().strftime("%Y-%m-%d"))
+        except Exception as e:
+            print(f"Error loading recorded attendance: {e}")
+            attendance_store_failed_at = time.time()
+    
+    attendance = []
+    for row in rows:
+        employee = employees_data[row]
+        record = None
+        if day is not None and employee['emp_code'] in attendance_slots:
+            record = recorded_attendance(day, attendance_slots[employee['emp_code']], employee['emp_code'], employee['emp_name'])
+        attendance.append(record or generate_today_attendance(employee['emp_code'], employee['emp_name']))
+    return attendance
+
+def ensure_indexes():
+    """Create the MongoDB indexes the hierarchy endpoints rely on"""
+    if hierarchies_collection is None or hierarchy_revisions_collection is None:
+        return
+    
+    try:
+        hierarchy_revisions_collection.create_index([("hierarchy_id", 1), ("revision", 1)], unique=True)
+        # Equality-sort-range order: pages walk the index in list order, and a name prefix is
+        # checked against the index keys instead of sorting every match in memory
+        hierarchies_collection.create_index([("updated_at", -1), ("hierarchy_id", -1), ("name_lower", 1)])
+        existing_indexes = hierarchies_collection.index_information()
+        for superseded in ("updated_at_-1_hierarchy_id_-1", "name_lower_1_updated_at_-1_hierarchy_id_-1"):
+            if superseded in existing_indexes:
+                hierarchies_collection.drop_index(superseded)
+        attendance_days_collection.create_index("date", unique=True)
+        attendance_slots_collection.create_index("emp_code", unique=True)
+        attendance_slots_collection.create_index("slot", unique=True)
+        attendance_rollups_collection.create_index([("period", 1), ("department", 1), ("location", 1)], unique=True)
+        images_collection.create_index("emp_code")
+        images_collection.create_index("image_hash")
+        image_import_jobs_collection.create_index("job_id", unique=True)
+        image_import_jobs_collection.create_index("expire_at", expireAfterSeconds=0)
+        image_import_results_collection.create_index([("job_id", 1), ("index", 1)])
+        image_import_results_collection.create_index("expire_at", expireAfterSeconds=0)
+        
+        # Hierarchies saved before the list view kept these fields cached
+        hierarchies_collection.update_many(
+            {"name_lower": {"$exists": False}},
+            [{"$set": {"name_lower": {"$toLower": "$name"}}}]
+        )
+        hierarchies_collection.update_many(
+            {"node_count": {"$exists": False}, "structure": {"$type": "object"}},
+            [{"$set": {"node_count": {"$size": {"$objectToArray": "$structure"}}}}]
+        )
+        migrate_inline_images()
+        hierarchies_collection.create_index("hierarchy_id", unique=True)
+    except Exception as e:
+        print(f"Error creating indexes: {e}")
+
+@app.on_event("startup")
+async def startup_event():
+    """Load employee data on startup"""
+    fetch_employee_data()
+    ensure_indexes()
+    try:
+        load_attendance_slots()
+    except Exception as e:
+        print(f"Error loading attendance slots: {e}")
+
+def iter_employees_ndjson(employees: List[Dict]) -> Iterator[bytes]:
+    """Yield employees with their images as NDJSON lines, one image query per chunk"""
+    for start in range(0, len(employees), STREAM_CHUNK_SIZE):
+        chunk = employees[start:start + STREAM_CHUNK_SIZE]
+        images = get_employee_images_from_db([emp['emp_code'] for emp in chunk])
+        
+        lines = []
+        for emp in chunk:
+            image_url = images.get(emp['emp_code'])
+            if image_url:
+                emp = {**emp, 'image_url': image_url}
+            lines.append(serialize_json(emp) + b"\n")
+        yield b"".join(lines)
+
+def stream_employees_response(request: Request) -> Response:
+    """Stream the whole directory as NDJSON, honouring If-None-Match"""
+    # Distinct ETag per representation, since /api/employees negotiates on Accept
+    etag = get_read_etag()[:-1] + '-ndjson"'
+    headers = {"ETag": etag, "Cache-Control": READ_CACHE_CONTROL, "Vary": "Accept"}
+    
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    
+    # Iterate over the snapshot taken now, so a reload mid-stream cannot mix datasets
+    return StreamingResponse(
+        iter_employees_ndjson(employees_data),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
+
+@app.get("/api/employees/stream")
+async def stream_all_employees(request: Request):
+    """Stream all employees with their images as newline-delimited JSON"""
+    return stream_employees_response(request)
+
+@app.get("/api/employees")
+async def get_all_employees(request: Request):
+    """Get all employees with their images (NDJSON stream when Accept: application/x-ndjson)"""
+    if 'application/x-ndjson' in request.headers.get('accept', ''):
+        return stream_employees_response(request)
+    
+    def build_payload():
+        images = get_employee_images_from_db([emp['emp_code'] for emp in employees_data])
+        enriched_employees = []
+        for emp in employees_data:
+            emp_copy = emp.copy()
+            # Add image URL if available
+            image_url = images.get(emp['emp_code'])
+            if image_url:
+                emp_copy['image_url'] = image_url
+            enriched_employees.append(emp_copy)
+        
+        return {"employees": enriched_employees}
+    
+    return conditional_read_response(request, build_payload)
+
+# Upper bound on emp_codes resolved by one batch lookup
+EMPLOYEE_BATCH_MAX_CODES = 5000
+
+@app.post("/api/employees/batch")
+async def get_employees_batch(request_data: Dict):
+    """Resolve many emp_codes in one request
+    
+    Body: {"emp_codes": [str], "fields": [str] (optional projection), "images": "ref" | "inline" | "none"}
+    images=ref (default) adds image_ref pointing at the immutable image URL; inline embeds the data URL.
+    """
+    emp_codes = request_data.get('emp_codes')
+    if not isinstance(emp_codes, list) or len(emp_codes) > EMPLOYEE_BATCH_MAX_CODES:
+        raise HTTPException(status_code=400, detail=f"emp_codes must be a list of at most {EMPLOYEE_BATCH_MAX_CODES} codes")
+    
+    fields = request_data.get('fields')
+    if fields is not None and (not isinstance(fields, list) or not all(isinstance(field, str) for field in fields)):
+        raise HTTPException(status_code=400, detail="fields must be a list of field names")
+    
+    images = request_data.get('images', 'ref')
+    if images not in ('ref', 'inline', 'none'):
+        raise HTTPException(status_code=400, detail="images must be 'ref', 'inline' or 'none'")
+    
+    rows = []
+    not_found = []
+    seen = set()
+    for code in emp_codes:
+        row = employee_rows.get(normalize_emp_code(code))
+        if row is None:
+            not_found.append(code)
+        elif row not in seen:
+            seen.add(row)
+            rows.append(row)
+    
+    found_codes = [employees_data[row]['emp_code'] for row in rows]
+    image_urls = {}
+    image_hashes = {}
+    if images == 'inline':
+        image_urls = get_employee_images_from_db(found_codes)
+    elif images == 'ref':
+        image_hashes = get_employee_image_hashes(found_codes)
+    
+    employees = []
+    for row in rows:
+        emp = employees_data[row]
+        emp_copy = {field: emp.get(field) for field in fields} if fields else emp.copy()
+        emp_copy['emp_code'] = emp['emp_code']
+        if emp['emp_code'] in image_urls:
+            emp_copy['image_url'] = image_urls[emp['emp_code']]
+        if emp['emp_code'] in image_hashes:
+            image_hash = image_hashes[emp['emp_code']]
+            emp_copy['image_ref'] = f"/api/images/{image_hash}" if image_hash else f"/api/employees/{emp['emp_code']}/image"
+        employees.append(emp_copy)
+    
+    return {"employees": employees, "count": len(employees), "not_found": not_found}
+
+# Relative importance of each field in global search; unlisted fields weigh 1
+SEARCH_FIELD_WEIGHTS = {
+    'emp_code': 10,
+    'emp_name': 8,
+    'extension_number': 6,
+    'mobile': 5,
+    'email': 2
+}
+
+# Multipliers for how well a field value matches the query
+SEARCH_MATCH_WEIGHTS = {
+    'exact': 4,
+    'prefix': 2,
+    'word_prefix': 1.5,
+    'substring': 1
+}
+
+def score_search_matches(q: str) -> Dict[int, float]:
+    """Relevance of every employee matching a normalized query, in one scan of the haystack
+    
+    Each field contributes its weight times how well its first occurrence of q matches.
+    """
+    row_scores = {}
+    if not q:
+        return row_scores
+    position = search_haystack.find(q)
+    while position >= 0:
+        row = bisect.bisect_right(search_row_starts, position) - 1
+        field_index = bisect.bisect_right(search_field_starts[row], position) - 1
+        field_start = search_field_starts[row][field_index]
+        field_end = search_haystack.find(SEARCH_FIELD_SEPARATOR, position)
+        
+        if position == field_start and field_end - field_start == len(q):
+            match_type = 'exact'
+        elif position == field_start:
+            match_type = 'prefix'
+        elif not search_haystack[position - 1].isalnum():
+            match_type = 'word_prefix'
+        else:
+            match_type = 'substring'
+        score = SEARCH_FIELD_WEIGHTS.get(SEARCH_HAYSTACK_FIELDS[field_index], 1) * SEARCH_MATCH_WEIGHTS[match_type]
+        row_scores[row] = row_scores.get(row, 0) + score
+        
+        # Later occurrences in the same field do not count again
+        position = search_haystack.find(q, field_end + 1)
+    return row_scores
+
+def ranked_name_search_payload(ranked: List[tuple]) -> Dict:
+    """Build a search response from (score, row) pairs ranked by name similarity"""
+    images = get_employee_images_from_db([employees_data[row]['emp_code'] for _, row in ranked])
+    
+    suggestions = []
+    enriched_matching = []
+    for score, row in ranked:
+        emp_copy = employees_data[row].copy()
+        emp_copy['match_score'] = score
+        image_url = images.get(emp_copy['emp_code'])
+        if image_url:
+            emp_copy['image_url'] = image_url
+        enriched_matching.append(emp_copy)
+        if emp_copy['emp_name'] not in suggestions and len(suggestions) < 10:
+            suggestions.append(emp_copy['emp_name'])
+    
+    return {
+        "suggestions": suggestions,
+        "employees": enriched_matching
+    }
+
+@app.get("/api/employees/search")
+async def search_employees(request: Request, q: str = "", field: str = "", match: str = "", limit: int = SEARCH_DEFAULT_LIMIT):
+    """Enhanced search employees with improved suggestions and filtering
+    
+    Without a field, matches across all fields are ranked by relevance and the best `limit` returned.
+    match=fuzzy ranks employees by typo-tolerant name similarity and match=phonetic by
+    sound-alike name spellings (field must be empty or emp_name for both).
+    """
+    name_matchers = {'fuzzy': fuzzy_search_names, 'phonetic': phonetic_search_names}
+    if match:
+        if match not in name_matchers:
+            raise HTTPException(status_code=400, detail="Invalid match mode. Use 'fuzzy' or 'phonetic'")
+        if field not in ('', 'emp_name'):
+            raise HTTPException(status_code=400, detail=f"{match.capitalize()} matching is only supported for emp_name")
+        if q:
+            return conditional_read_response(
+                request,
+                lambda: ranked_name_search_payload(name_matchers[match](q, limit)),
+                {"q": q.lower(), "field": "emp_name", "match": match, "limit": str(limit)}
+            )
+    
+    def build_payload(q: str):
+        # Normalize first: a query of only separator characters normalizes to nothing
+        q = normalize_search_text(q)
+        if not q:
+            # Return all employees and some sample suggestions for the field
+            suggestions = []
+            if field and field in ['emp_code', 'emp_name', 'department', 'location', 'designation', 'mobile', 'extension_number', 'email']:
+                # Get first 10 unique values for suggestions
+                field_values = set()
+                for emp in employees_data:
+                    if field in emp and emp[field]:
+                        field_values.add(emp[field])
+                suggestions = sorted(list(field_values))[:10]
+        
+            # Return employees with images
+            images = get_employee_images_from_db([emp['emp_code'] for emp in employees_data])
+            enriched_employees = []
+            for emp in employees_data:
+                emp_copy = emp.copy()
+                image_url = images.get(emp['emp_code'])
+                if image_url:
+                    emp_copy['image_url'] = image_url
+                enriched_employees.append(emp_copy)
+        
+            return {"suggestions": suggestions, "employees": enriched_employees}
+        
+        suggestions = []
+        matching_employees = []
+        
+        # Enhanced search with email, extension_number and joining_date included
+        searchable_fields = ['emp_code', 'emp_name', 'department', 'location', 'designation', 'mobile', 'extension_number', 'email']
+        
+        if field and field in searchable_fields:
+            # Special handling for emp_name to provide better context
+            if field == 'emp_name':
+                # For names, we want to show unique combinations to avoid confusion
+                unique_name_combinations = {}
+                for row, emp in enumerate(employees_data):
+                    normalized_name = search_rows[row][field]
+                    if normalized_name and q in normalized_name:
+                        if normalized_name not in unique_name_combinations:
+                            # Only add if we haven't seen this exact name before
+                            unique_name_combinations[normalized_name] = emp[field]
+                        matching_employees.append(emp)
+            
+                # Provide suggestions as just names but ensure matching is exact
+                starts_with = [name for normalized, name in unique_name_combinations.items() if normalized.startswith(q)]
+                contains = [name for normalized, name in unique_name_combinations.items() if not normalized.startswith(q)]
+                suggestions = sorted(starts_with) + sorted(contains)
+                suggestions = suggestions[:10]
+            else:
+                # For other fields, use the normal logic, collecting distinct matching values as we go
+                field_values = {}
+                for row, emp in enumerate(employees_data):
+                    normalized_value = search_rows[row][field]
+                    if normalized_value and q in normalized_value:
+                        field_values[emp[field]] = normalized_value
+                        matching_employees.append(emp)
+            
+                # Enhanced suggestions: show both "starts with" and "contains" results
+                starts_with = [val for val, normalized in field_values.items() if normalized.startswith(q)]
+                contains = [val for val, normalized in field_values.items() if not normalized.startswith(q)]
+            
+                # Prioritize "starts with" matches, then "contains" matches
+                suggestions = sorted(starts_with) + sorted(contains)
+                suggestions = suggestions[:10]  # Limit to 10 suggestions
+        else:
+            # Global search across all fields, keeping only the best `limit` matches by relevance
+            row_scores = score_search_matches(q)
+            for row, score in heapq.nlargest(limit, row_scores.items(), key=lambda item: (item[1], -item[0])):
+                matching_employees.append({**employees_data[row], 'match_score': score})
+        
+        # Add images to matching employees
+        images = get_employee_images_from_db([emp['emp_code'] for emp in matching_employees])
+        enriched_matching = []
+        for emp in matching_employees:
+            emp_copy = emp.copy()
+            image_url = images.get(emp['emp_code'])
+            if image_url:
+                emp_copy['image_url'] = image_url
+            enriched_matching.append(emp_copy)
+        
+        return {
+            "suggestions": suggestions,
+            "employees": enriched_matching
+        }
+    
+    return conditional_read_response(request, lambda: build_payload(q), {"q": normalize_search_text(q), "field": field, "limit": str(limit)})
+
+@app.get("/api/employees/filter")
+async def filter_employees(
+    request: Request,
+    emp_code: str = "",
+    emp_name: str = "",
+    department: str = "",
+    location: str = "",
+    designation: str = "",  # Changed from grade to designation
+    mobile: str = "",
+    extension_number: str = "",
+    email: str = ""
+):
+    """Filter employees by multiple criteria (changed grade to designation, added extension_number)"""
+    def build_payload():
+        filters = {
+            'emp_code': emp_code,
+            'emp_name': emp_name,
+            'department': department,
+            'location': location,
+            'designation': designation,  # Changed from grade
+            'mobile': mobile,
+            'extension_number': extension_number,
+            'email': email
+        }
+        
+        # Compare against the precomputed normalized columns
+        active_filters = [(field, normalize_search_text(value)) for field, value in filters.items() if value]
+        filtered_employees = [
+            emp for row, emp in enumerate(employees_data)
+            if all(search_rows[row][field] == value for field, value in active_filters)
+        ]
+        
+        # Add images to filtered employees
+        images = get_employee_images_from_db([emp['emp_code'] for emp in filtered_employees])
+        enriched_filtered = []
+        for emp in filtered_employees:
+            emp_copy = emp.copy()
+            image_url = images.get(emp['emp_code'])
+            if image_url:
+                emp_copy['image_url'] = image_url
+            enriched_filtered.append(emp_copy)
+        
+        return {"employees": enriched_filtered}
     
-    # Generate today's attendance
-    attendance = generate_today_attendance(emp_code, employee['emp_name'])
+    # Matching is case-insensitive, so differently cased filters share one cache entry
+    cache_params = {
+        'emp_code': normalize_search_text(emp_code),
+        'emp_name': normalize_search_text(emp_name),
+        'department': normalize_search_text(department),
+        'location': normalize_search_text(location),
+        'designation': normalize_search_text(designation),
+        'mobile': normalize_search_text(mobile),
+        'extension_number': normalize_search_text(extension_number),
+        'email': normalize_search_text(email)
+    }
+    return conditional_read_response(request, build_payload, cache_params)
+
+@app.get("/api/employees/{emp_code}/attendance")
+async def get_employee_attendance(emp_code: str):
+    """Get today's attendance for a specific employee"""
+    # Recorded attendance wins; otherwise memoized per (employee, day) so repeated views agree
+    attendance = current_attendance([get_employee_row(emp_code)])[0]
     
     return {"attendance": attendance}
 
+# Upper bound on explicitly listed emp_codes per batch attendance request
+ATTENDANCE_BATCH_MAX_CODES = 5000
+
+@app.post("/api/attendance/batch")
+async def get_batch_attendance(request_data: Dict):
+    """Get today's attendance for a department, a list of emp_codes or a manager's team in one response
+    
+    Body: {"department": str} | {"emp_codes": [str]} | {"manager": str, "direct_only": bool}
+    """
+    department = request_data.get('department')
+    emp_codes = request_data.get('emp_codes')
+    manager = request_data.get('manager')
+    if sum(1 for selector in (department, emp_codes, manager) if selector) != 1:
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'department', 'emp_codes' or 'manager'")
+    
+    not_found = []
+    if department:
+        normalized_department = normalize_search_text(department)
+        rows = [row for row in range(len(employees_data)) if search_rows[row]['department'] == normalized_department]
+    elif emp_codes:
+        if not isinstance(emp_codes, list) or len(emp_codes) > ATTENDANCE_BATCH_MAX_CODES:
+            raise HTTPException(status_code=400, detail=f"emp_codes must be a list of at most {ATTENDANCE_BATCH_MAX_CODES} codes")
+        rows = []
+        seen = set()
+        for code in emp_codes:
+            row = employee_rows.get(normalize_emp_code(code))
+            if row is None:
+                not_found.append(code)
+            elif row not in seen:
+                seen.add(row)
+                rows.append(row)
+    else:
+        manager_row = get_employee_row(manager)
+        if request_data.get('direct_only'):
+            rows = org_children[manager_row]
+        else:
+            rows = org_preorder[org_tin[manager_row] + 1:org_tout[manager_row]]
+    
+    attendance = current_attendance(rows)
+    
+    summary = {status: 0 for status in ATTENDANCE_STATUSES}
+    for record in attendance:
+        summary[record.status] += 1
+    
+    return {
+        "date": datetime.now().strftime("%Y-%m-%d"),
+        "count": len(attendance),
+        "summary": summary,
+        "attendance": attendance,
+        "not_found": not_found
+    }
+
+def attendance_rate(counts: Dict[str, int]) -> Optional[float]:
+    """Percentage of recorded employee-days that were not absences"""
+    if not counts.get("recorded"):
+        return None
+    return round(100 * (counts["recorded"] - counts.get("absent", 0)) / counts["recorded"], 1)
+
+def parse_attendance_date(value: str, field: str) -> datetime:
+    """Parse a YYYY-MM-DD query value, 400 on anything else"""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"'{field}' must be a date in YYYY-MM-DD format")
+
+def attendance_scope_rows(department: str = "", location: str = "") -> List[int]:
+    """Rows of employees_data in a department and/or location (normalized match), all rows by default"""
+    normalized_department = normalize_search_text(department) if department else None
+    normalized_location = normalize_search_text(location) if location else None
+    return [
+        row for row in range(len(employees_data))
+        if (normalized_department is None or search_rows[row]['department'] == normalized_department)
+        and (normalized_location is None or search_rows[row]['location'] == normalized_location)
+    ]
+
+def slots_bitmask(slots: List[int]) -> int:
+    """Bitset with the given slots set"""
+    if not slots:
+        return 0
+    packed = bytearray((max(slots) + 8) // 8)
+    for slot in slots:
+        packed[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(packed, 'little')
+
+@app.post("/api/attendance/records")
+async def record_attendance(request_data: Dict):
+    """Record attendance for one day into the bit-packed store
+    
+    Body: {"date": "YYYY-MM-DD" (default today), "records": [{"emp_code", "status", "check_in": "HH:MM", "check_out": "HH:MM"}]}
+    """
+    if attendance_days_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    
+    # Canonical YYYY-MM-DD so day documents and rollup keys match what range queries look up
+    date = parse_attendance_date(request_data.get('date') or datetime.now().strftime("%Y-%m-%d"), 'date').strftime("%Y-%m-%d")
+    records = request_data.get('records')
+    if not isinstance(records, list) or not records:
+        raise HTTPException(status_code=400, detail="'records' must be a non-empty list")
+    
+    parsed = []
+    not_found = []
+    for record in records:
+        record = record if isinstance(record, dict) else {}
+        row = employee_rows.get(normalize_emp_code(record.get('emp_code')))
+        if row is None:
+            not_found.append(record.get('emp_code'))
+            continue
+        status = record.get('status')
+        if status not in ATTENDANCE_STATUS_FIELDS:
+            raise HTTPException(status_code=400, detail=f"Invalid status for {record.get('emp_code')}; expected one of {ATTENDANCE_STATUSES}")
+        try:
+            check_in = parse_attendance_minutes(record.get('check_in'))
+            check_out = parse_attendance_minutes(record.get('check_out'))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid check_in/check_out for {record.get('emp_code')}; expected HH:MM")
+        # Each record is counted under the employee's department and location as of this write
+        group = (employees_data[row].get('department', ''), employees_data[row].get('location', ''))
+        parsed.append((employees_data[row]['emp_code'], status, check_in, check_out, group))
+    
+    try:
+        slots = assign_attendance_slots([entry[0] for entry in parsed])
+        if parsed:
+            record_attendance_day(date, [(slots[code], status, check_in, check_out, group) for code, status, check_in, check_out, group in parsed])
+            sync_attendance_rollups(date)
+        
+        return {"success": True, "date": date, "recorded": len(parsed), "not_found": not_found}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error recording attendance: {str(e)}")
+
+@app.get("/api/attendance/range")
+async def get_attendance_range(
+    start: str,
+    end: str,
+    status: str = "Absent",
+    department: str = "",
+    location: str = "",
+    match: str = "any"
+):
+    """Employees with a recorded status between two dates, e.g. who was absent last week in Finance
+    
+    match=any lists employees with the status on at least one recorded day (with their day count);
+    match=all only those with it on every recorded day. Answered with bitwise operations per day.
+    """
+    if attendance_days_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    if status not in ATTENDANCE_STATUS_FIELDS:
+        raise HTTPException(status_code=400, detail=f"'status' must be one of {ATTENDANCE_STATUSES}")
+    if match not in ("any", "all"):
+        raise HTTPException(status_code=400, detail="'match' must be 'any' or 'all'")
+    
+    start_date = parse_attendance_date(start, 'start')
+    end_date = parse_attendance_date(end, 'end')
+    if end_date < start_date or (end_date - start_date).days >= ATTENDANCE_RANGE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range must be ascending and at most {ATTENDANCE_RANGE_MAX_DAYS} days")
+    
+    try:
+        load_attendance_slots()
+        scope_rows = attendance_scope_rows(department, location)
+        slot_rows = {attendance_slots[employees_data[row]['emp_code']]: row for row in scope_rows if employees_data[row]['emp_code'] in attendance_slots}
+        scope_mask = slots_bitmask(list(slot_rows))
+        
+        field = ATTENDANCE_STATUS_FIELDS[status]
+        days = attendance_days_collection.find(
+            {"date": {"$gte": start_date.strftime("%Y-%m-%d"), "$lte": end_date.strftime("%Y-%m-%d")}},
+            {"_id": 0, "date": 1, field: 1}
+        ).sort("date", 1)
+        
+        day_count = 0
+        day_hits = {}
+        every_day = scope_mask
+        for doc in days:
+            day_count += 1
+            bits = int.from_bytes(doc.get(field) or b"", 'little') & scope_mask
+            every_day &= bits
+            for slot in iter_set_bits(bits):
+                day_hits.setdefault(slot, []).append(doc["date"])
+        
+        selected = iter_set_bits(every_day) if match == "all" and day_count else day_hits
+        employees = [
+            {**employees_data[slot_rows[slot]], "dates": day_hits[slot], "days": len(day_hits[slot])}
+            for slot in selected
+        ]
+        employees.sort(key=lambda emp: (-emp["days"], emp["emp_name"]))
+        
+        return {
+            "start": start_date.strftime("%Y-%m-%d"),
+            "end": end_date.strftime("%Y-%m-%d"),
+            "status": status,
+            "match": match,
+            "recorded_days": day_count,
+            "scope_count": len(scope_rows),
+            "count": len(employees),
+            "employees": employees
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error querying attendance: {str(e)}")
+
+@app.get("/api/attendance/rollups")
+async def get_attendance_rollups(period: str = "month", date: str = "", department: str = "", location: str = ""):
+    """Attendance percentages by department and location for the day, week or month containing date
+    
+    Served from rollups maintained on every write, so the cost is proportional to the number of groups.
+    """
+    if attendance_rollups_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    if period not in ATTENDANCE_ROLLUP_PERIODS:
+        raise HTTPException(status_code=400, detail=f"'period' must be one of {ATTENDANCE_ROLLUP_PERIODS}")
+    
+    date = parse_attendance_date(date or datetime.now().strftime("%Y-%m-%d"), 'date').strftime("%Y-%m-%d")
+    period_key = attendance_rollup_periods(date)[ATTENDANCE_ROLLUP_PERIODS.index(period)]
+    
+    normalized_department = normalize_search_text(department)
+    normalized_location = normalize_search_text(location)
+    
+    try:
+        groups = []
+        totals = {field: 0 for field in ["recorded", *ATTENDANCE_STATUS_FIELDS.values()]}
+        for doc in attendance_rollups_collection.find({"period": period_key}, {"_id": 0, "department": 1, "location": 1, "counts": 1}):
+            if department and normalize_search_text(doc["department"]) != normalized_department:
+                continue
+            if location and normalize_search_text(doc["location"]) != normalized_location:
+                continue
+            counts = {field: doc.get("counts", {}).get(field, 0) for field in totals}
+            for field, value in counts.items():
+                totals[field] += value
+            groups.append({"department": doc["department"], "location": doc["location"], "counts": counts, "attendance_rate": attendance_rate(counts)})
+        
+        groups.sort(key=lambda group: (group["department"], group["location"]))
+        return {
+            "period": period_key,
+            "groups": groups,
+            "totals": {"counts": totals, "attendance_rate": attendance_rate(totals)}
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching attendance rollups: {str(e)}")
+
 @app.get("/api/department/{department_name}/employees")
-async def get_department_employees(department_name: str):
+async def get_department_employees(request: Request, department_name: str):
     """Get all employees in a specific department"""
-    dept_employees = [
-        emp for emp in employees_data 
-        if emp.get('department', '').lower() == department_name.lower()
-    ]
+    def build_payload():
+        normalized_department = normalize_search_text(department_name)
+        dept_employees = [
+            emp for row, emp in enumerate(employees_data)
+            if search_rows[row]['department'] == normalized_department
+        ]
+        
+        return {"employees": dept_employees, "department": department_name, "count": len(dept_employees)}
     
-    return {"employees": dept_employees, "department": department_name, "count": len(dept_employees)}
+    return conditional_read_response(request, build_payload)
 
 @app.get("/api/field-values")
-async def get_field_values():
+async def get_field_values(request: Request):
     """Get all unique values for each searchable field (changed grades to designations, added extension_numbers)"""
-    field_values = {
-        'departments': list(set(emp.get('department', '') for emp in employees_data if emp.get('department'))),
-        'locations': list(set(emp.get('location', '') for emp in employees_data if emp.get('location'))),
-        'designations': list(set(emp.get('designation', '') for emp in employees_data if emp.get('designation'))),  # Changed from grades
-        'emp_codes': list(set(emp.get('emp_code', '') for emp in employees_data if emp.get('emp_code'))),
-        'emp_names': list(set(emp.get('emp_name', '') for emp in employees_data if emp.get('emp_name'))),
-        'mobiles': list(set(emp.get('mobile', '') for emp in employees_data if emp.get('mobile'))),
-        'extension_numbers': list(set(emp.get('extension_number', '') for emp in employees_data if emp.get('extension_number'))),
-        'emails': list(set(emp.get('email', '') for emp in employees_data if emp.get('email')))
+    def build_payload():
+        # Sorted so that identical snapshots always serialize to identical bodies under one ETag
+        field_values = {
+            'departments': sorted(set(emp.get('department', '') for emp in employees_data if emp.get('department'))),
+            'locations': sorted(set(emp.get('location', '') for emp in employees_data if emp.get('location'))),
+            'designations': sorted(set(emp.get('designation', '') for emp in employees_data if emp.get('designation'))),  # Changed from grades
+            'emp_codes': sorted(set(emp.get('emp_code', '') for emp in employees_data if emp.get('emp_code'))),
+            'emp_names': sorted(set(emp.get('emp_name', '') for emp in employees_data if emp.get('emp_name'))),
+            'mobiles': sorted(set(emp.get('mobile', '') for emp in employees_data if emp.get('mobile'))),
+            'extension_numbers': sorted(set(emp.get('extension_number', '') for emp in employees_data if emp.get('extension_number'))),
+            'emails': sorted(set(emp.get('email', '') for emp in employees_data if emp.get('email')))
+        }
+        
+        return field_values
+    
+    return conditional_read_response(request, build_payload)
+
+def get_employee_row(emp_code: str) -> int:
+    """Row of an employee in employees_data via the primary-key index"""
+    row = employee_rows.get(normalize_emp_code(emp_code))
+    if row is None:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    return row
+
+# Page size bounds for lazy org chart expansion
+ORG_PAGE_DEFAULT_LIMIT = 50
+ORG_PAGE_MAX_LIMIT = 500
+
+def org_children_page(child_rows: List[int], offset: int, limit: int) -> Dict:
+    """One page of tree nodes, each with its precomputed descendant count"""
+    if offset < 0 or limit < 1:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit >= 1")
+    limit = min(limit, ORG_PAGE_MAX_LIMIT)
+    
+    children = []
+    for row in child_rows[offset:offset + limit]:
+        children.append({
+            **employees_data[row],
+            'direct_reports': len(org_children[row]),
+            'descendant_count': org_tout[row] - org_tin[row] - 1
+        })
+    
+    next_offset = offset + limit
+    return {
+        "children": children,
+        "total": len(child_rows),
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset if next_offset < len(child_rows) else None
     }
+
+@app.get("/api/org/roots")
+async def get_org_roots(request: Request, offset: int = 0, limit: int = ORG_PAGE_DEFAULT_LIMIT):
+    """Get the top of the org chart (employees without a manager), page by page"""
+    def build_payload():
+        return {"parent": None, **org_children_page(org_roots, offset, limit)}
     
-    return field_values
+    return conditional_read_response(request, build_payload)
+
+@app.get("/api/org/{emp_code}/children")
+async def get_org_children(request: Request, emp_code: str, offset: int = 0, limit: int = ORG_PAGE_DEFAULT_LIMIT):
+    """Expand one org chart node: its direct reports page by page, with descendant counts"""
+    row = get_employee_row(emp_code)
+    
+    def build_payload():
+        return {"parent": employees_data[row]['emp_code'], **org_children_page(org_children[row], offset, limit)}
+    
+    return conditional_read_response(request, build_payload)
+
+# Maximum number of pairs answered by one batch common-manager request
+ORG_BATCH_MAX_PAIRS = 10000
+
+def common_manager_result(a_row: int, b_row: int) -> Dict:
+    """Lowest common manager of two rows and the reporting distance between them"""
+    manager = lowest_common_manager(a_row, b_row)
+    if manager == -1:
+        return {"common_manager_code": None, "common_manager_name": None, "distance": None}
+    
+    return {
+        "common_manager_code": employees_data[manager]['emp_code'],
+        "common_manager_name": employees_data[manager]['emp_name'],
+        "distance": org_depth[a_row] + org_depth[b_row] - 2 * org_depth[manager]
+    }
+
+@app.get("/api/org/common-manager")
+async def get_common_manager(a: str, b: str):
+    """Get the first manager shared by two employees and how many reporting hops separate them"""
+    a_row = get_employee_row(a)
+    b_row = get_employee_row(b)
+    
+    return {"a": employees_data[a_row]['emp_code'], "b": employees_data[b_row]['emp_code'], **common_manager_result(a_row, b_row)}
+
+@app.post("/api/org/common-manager/batch")
+async def get_common_managers_batch(request_data: dict):
+    """Get common managers for many employee pairs: {"pairs": [["a", "b"], ...]}"""
+    pairs = request_data.get('pairs')
+    if not isinstance(pairs, list):
+        raise HTTPException(status_code=400, detail="'pairs' must be a list of [a, b] employee code pairs")
+    if len(pairs) > ORG_BATCH_MAX_PAIRS:
+        raise HTTPException(status_code=400, detail=f"At most {ORG_BATCH_MAX_PAIRS} pairs per request")
+    
+    results = []
+    for pair in pairs:
+        if isinstance(pair, dict):
+            pair = [pair.get('a'), pair.get('b')]
+        if not isinstance(pair, list) or len(pair) != 2:
+            results.append({"a": None, "b": None, "error": "Invalid pair"})
+            continue
+        
+        a, b = pair
+        a_row = employee_rows.get(normalize_emp_code(a))
+        b_row = employee_rows.get(normalize_emp_code(b))
+        if a_row is None or b_row is None:
+            results.append({"a": a, "b": b, "error": "Employee not found"})
+            continue
+        
+        results.append({"a": a, "b": b, **common_manager_result(a_row, b_row)})
+    
+    return {"results": results, "count": len(results)}
+
+def tidy_tree_layout(children: List[List[int]], root: int) -> List[float]:
+    """Reingold-Tilford tidy tree x coordinates in linear time (Buchheim-Junger-Leipert variant of Walker)
+    
+    Nodes are 0..N-1 with ordered child lists; siblings and contour neighbours are kept
+    at least one unit apart. Both walks are iterative, so depth is not limited by recursion.
+    """
+    count = len(children)
+    parent = [-1] * count
+    number = [0] * count  # 1-based position among siblings
+    for node in range(count):
+        for position, child in enumerate(children[node], 1):
+            parent[child] = node
+            number[child] = position
+    
+    prelim = [0.0] * count
+    mod = [0.0] * count
+    shift = [0.0] * count
+    change = [0.0] * count
+    thread = [-1] * count
+    ancestor = list(range(count))
+    
+    def left_sibling(node: int) -> int:
+        return children[parent[node]][number[node] - 2] if parent[node] != -1 and number[node] > 1 else -1
+    
+    def next_left(node: int) -> int:
+        return children[node][0] if children[node] else thread[node]
+    
+    def next_right(node: int) -> int:
+        return children[node][-1] if children[node] else thread[node]
+    
+    def move_subtree(left: int, right: int, amount: float):
+        subtrees = number[right] - number[left]
+        change[right] -= amount / subtrees
+        shift[right] += amount
+        change[left] += amount / subtrees
+        prelim[right] += amount
+        mod[right] += amount
+    
+    def apportion(node: int, default_ancestor: int) -> int:
+        sibling = left_sibling(node)
+        if sibling == -1:
+            return default_ancestor
+        
+        inner_right = outer_right = node
+        inner_left = sibling
+        outer_left = children[parent[node]][0]
+        sum_inner_right = mod[inner_right]
+        sum_outer_right = mod[outer_right]
+        sum_inner_left = mod[inner_left]
+        sum_outer_left = mod[outer_left]
+        while next_right(inner_left) != -1 and next_left(inner_right) != -1:
+            inner_left = next_right(inner_left)
+            inner_right = next_left(inner_right)
+            outer_left = next_left(outer_left)
+            outer_right = next_right(outer_right)
+            ancestor[outer_right] = node
+            gap = (prelim[inner_left] + sum_inner_left) - (prelim[inner_right] + sum_inner_right) + 1
+            if gap > 0:
+                left_ancestor = ancestor[inner_left] if parent[ancestor[inner_left]] == parent[node] else default_ancestor
+                move_subtree(left_ancestor, node, gap)
+                sum_inner_right += gap
+                sum_outer_right += gap
+            sum_inner_left += mod[inner_left]
+            sum_inner_right += mod[inner_right]
+            sum_outer_left += mod[outer_left]
+            sum_outer_right += mod[outer_right]
+        
+        if next_right(inner_left) != -1 and next_right(outer_right) == -1:
+            thread[outer_right] = next_right(inner_left)
+            mod[outer_right] += sum_inner_left - sum_outer_right
+        if next_left(inner_right) != -1 and next_left(outer_left) == -1:
+            thread[outer_left] = next_left(inner_right)
+            mod[outer_left] += sum_inner_right - sum_outer_left
+            default_ancestor = node
+        return default_ancestor
+    
+    def finish_node(node: int):
+        sibling = left_sibling(node)
+        if not children[node]:
+            prelim[node] = prelim[sibling] + 1 if sibling != -1 else 0.0
+            return
+        
+        # Execute the shifts accumulated by apportion, right to left
+        total_shift = 0.0
+        total_change = 0.0
+        for child in reversed(children[node]):
+            prelim[child] += total_shift
+            mod[child] += total_shift
+            total_change += change[child]
+            total_shift += shift[child] + total_change
+        
+        midpoint = (prelim[children[node][0]] + prelim[children[node][-1]]) / 2
+        if sibling != -1:
+            prelim[node] = prelim[sibling] + 1
+            mod[node] = prelim[node] - midpoint
+        else:
+            prelim[node] = midpoint
+    
+    # First walk in post-order; each child is apportioned against its left siblings
+    # as soon as its own subtree is finished
+    stack = [[root, 0, children[root][0] if children[root] else root]]
+    while stack:
+        frame = stack[-1]
+        node, next_child, default_ancestor = frame
+        if next_child < len(children[node]):
+            frame[1] += 1
+            child = children[node][next_child]
+            stack.append([child, 0, children[child][0] if children[child] else child])
+            continue
+        
+        finish_node(node)
+        stack.pop()
+        if stack:
+            stack[-1][2] = apportion(node, stack[-1][2])
+    
+    # Second walk in pre-order sums the modifiers along each path
+    x = [0.0] * count
+    stack = [(root, 0.0)]
+    while stack:
+        node, modifier_sum = stack.pop()
+        x[node] = prelim[node] + modifier_sum
+        for child in children[node]:
+            stack.append((child, modifier_sum + mod[node]))
+    
+    return x
+
+def layout_payload(codes: List[str], names: List[str], children: List[List[int]], roots: List[int]) -> Dict:
+    """Lay out a forest of nodes and return per-node x/y with the layout's extent"""
+    # A virtual super-root lets a forest be laid out as one tree
+    count = len(codes)
+    virtual_root = count
+    tree_children = children + [roots]
+    x = tidy_tree_layout(tree_children, virtual_root)
+    
+    depth = [0] * (count + 1)
+    parent = [-1] * (count + 1)
+    for node in range(count + 1):
+        for child in tree_children[node]:
+            parent[child] = node
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        for child in children[node]:
+            depth[child] = depth[node] + 1
+            stack.append(child)
+    
+    min_x = min((x[node] for node in range(count)), default=0.0)
+    nodes = []
+    for node in range(count):
+        nodes.append({
+            "emp_code": codes[node],
+            "emp_name": names[node],
+            "parent": codes[parent[node]] if parent[node] not in (-1, virtual_root) else None,
+            "x": round(x[node] - min_x, 3),
+            "y": depth[node]
+        })
+    
+    return {
+        "nodes": nodes,
+        "count": count,
+        "width": round(max((node["x"] for node in nodes), default=0.0), 3),
+        "height": max(depth[:count], default=0)
+    }
+
+def org_subtree_layout(root_row: int) -> Dict:
+    """Tidy layout of the reporting_id subtree under one employee"""
+    rows = org_preorder[org_tin[root_row]:org_tout[root_row]]
+    local = {row: index for index, row in enumerate(rows)}
+    children = [[local[child] for child in org_children[row]] for row in rows]
+    
+    payload = layout_payload(
+        [employees_data[row]['emp_code'] for row in rows],
+        [employees_data[row]['emp_name'] for row in rows],
+        children,
+        [0]
+    )
+    return {"root": employees_data[root_row]['emp_code'], "hierarchy_id": None, **payload}
+
+def hierarchy_structure_layout(hierarchy_id: str, structure: Dict) -> Dict:
+    """Tidy layout of a saved hierarchy structure ({emp_code: {..., "manager": emp_code}})"""
+    codes = list(structure.keys())
+    local = {code: index for index, code in enumerate(codes)}
+    
+    managers = []
+    for code in codes:
+        node = structure[code] if isinstance(structure[code], dict) else {}
+        managers.append(local.get(str(node.get('manager') or ''), -1))
+    
+    # Nodes caught in a manager cycle are attached at the top, like rows in build_org_index
+    children = [[] for _ in codes]
+    roots = []
+    state = [0] * len(codes)
+    for start in range(len(codes)):
+        path = []
+        node = start
+        while node != -1 and state[node] == 0:
+            state[node] = 1
+            path.append(node)
+            node = managers[node]
+        if node != -1 and state[node] == 1:
+            managers[node] = -1
+        for visited in path:
+            state[visited] = 2
+    for index, manager in enumerate(managers):
+        if manager == -1:
+            roots.append(index)
+        else:
+            children[manager].append(index)
+    
+    names = []
+    for code in codes:
+        row = employee_rows.get(normalize_emp_code(code))
+        if row is not None:
+            names.append(employees_data[row]['emp_name'])
+        else:
+            node = structure[code] if isinstance(structure[code], dict) else {}
+            names.append(node.get('emp_name', ''))
+    
+    return {"root": None, "hierarchy_id": hierarchy_id, **layout_payload(codes, names, children, roots)}
+
+@app.get("/api/org/layout")
+async def get_org_layout(request: Request, root: str = "", hierarchy_id: str = ""):
+    """Get a precomputed tidy-tree layout (x/y per node) for an employee's subtree or a saved hierarchy
+    
+    x is in units of minimum node separation and y is the depth below the top.
+    """
+    if bool(root) == bool(hierarchy_id):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'root' or 'hierarchy_id'")
+    
+    if root:
+        root_row = get_employee_row(root)
+        return conditional_read_response(request, lambda: org_subtree_layout(root_row), {"root": employees_data[root_row]['emp_code']})
+    
+    if hierarchies_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    
+    hierarchy_meta = hierarchies_collection.find_one({"hierarchy_id": hierarchy_id}, {"updated_at": 1})
+    if not hierarchy_meta:
+        raise HTTPException(status_code=404, detail="Hierarchy not found")
+    
+    def build_payload():
+        hierarchy_doc = hierarchies_collection.find_one({"hierarchy_id": hierarchy_id})
+        if not hierarchy_doc:
+            raise HTTPException(status_code=404, detail="Hierarchy not found")
+        structure = decode_hierarchy_structure(hierarchy_doc)
+        if not isinstance(structure, dict):
+            raise HTTPException(status_code=400, detail="Hierarchy structure must map emp_code to node")
+        return hierarchy_structure_layout(hierarchy_id, structure)
+    
+    # Saved hierarchies change independently of the employee snapshot
+    version_scope = hashlib.sha256(str(hierarchy_meta.get("updated_at")).encode('utf-8')).hexdigest()[:8]
+    return conditional_read_response(request, build_payload, {"hierarchy_id": hierarchy_id}, version_scope)
+
+@app.get("/api/org/{emp_code}/reports")
+async def get_direct_reports(request: Request, emp_code: str):
+    """Get an employee's direct reports from the reporting_id tree"""
+    row = get_employee_row(emp_code)
+    
+    def build_payload():
+        reports = [employees_data[child] for child in org_children[row]]
+        return {"emp_code": employees_data[row]['emp_code'], "reports": reports, "count": len(reports)}
+    
+    return conditional_read_response(request, build_payload)
+
+@app.get("/api/org/{emp_code}/subtree")
+async def get_org_subtree(request: Request, emp_code: str, max_depth: int = 0):
+    """Get everyone reporting directly or indirectly to an employee, in pre-order"""
+    row = get_employee_row(emp_code)
+    
+    def build_payload():
+        base_depth = org_depth[row]
+        employees = []
+        # The subtree is one contiguous slice of the pre-order numbering
+        for descendant in org_preorder[org_tin[row] + 1:org_tout[row]]:
+            level = org_depth[descendant] - base_depth
+            if max_depth and level > max_depth:
+                continue
+            employees.append({
+                **employees_data[descendant],
+                'level': level,
+                'manager_code': employees_data[org_parent[descendant]]['emp_code']
+            })
+        return {"emp_code": employees_data[row]['emp_code'], "employees": employees, "count": len(employees)}
+    
+    return conditional_read_response(request, build_payload)
+
+@app.get("/api/org/{emp_code}/subtree-size")
+async def get_org_subtree_size(emp_code: str):
+    """Get the number of direct and indirect reports of an employee"""
+    row = get_employee_row(emp_code)
+    
+    return {
+        "emp_code": employees_data[row]['emp_code'],
+        "direct_reports": len(org_children[row]),
+        "subtree_size": org_tout[row] - org_tin[row] - 1,
+        "depth": org_depth[row]
+    }
+
+@app.get("/api/org/{emp_code}/chain")
+async def get_management_chain(emp_code: str):
+    """Get the management chain of an employee, from direct manager up to the top"""
+    row = get_employee_row(emp_code)
+    
+    chain = []
+    manager = org_parent[row]
+    while manager != -1:
+        chain.append(employees_data[manager])
+        manager = org_parent[manager]
+    
+    return {"emp_code": employees_data[row]['emp_code'], "chain": chain, "depth": org_depth[row]}
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Get response cache statistics (size, hit ratio, evictions)"""
+    return {
+        "response_cache": response_cache.stats(),
+        "attendance_cache": {**attendance_cache_stats, "entries": len(attendance_cache), "date": attendance_cache_date},
+        "dataset_version": dataset_version,
+        "images_version": current_images_version()
+    }
 
 @app.post("/api/refresh-data")
 async def refresh_employee_data():
     """Manually refresh employee data from Excel file"""
     fetch_employee_data()
-    return {"message": f"Data refreshed successfully. Loaded {len(employees_data)} employees from Excel file.", "source": "excel"}
+    return {
+        "message": f"Data refreshed successfully. Loaded {len(employees_data)} employees from Excel file.",
+        "source": "excel",
+        "reporting_validation": reporting_validation
+    }
 
 @app.post("/api/upload-excel")
 async def upload_excel_file(file: UploadFile = File(...)):
@@ -564,7 +2693,8 @@ async def upload_excel_file(file: UploadFile = File(...)):
                 "success": True,
                 "message": f"Excel file uploaded and processed successfully. Loaded {len(employees_data)} employees.",
                 "filename": file.filename,
-                "employees_count": len(employees_data)
+                "employees_count": len(employees_data),
+                "reporting_validation": reporting_validation
             }
         else:
             raise HTTPException(status_code=400, detail="Failed to process Excel file. Please check the format and columns.")
@@ -584,7 +2714,10 @@ async def get_data_source_info():
         "employees_count": len(employees_data),
         "last_updated": datetime.now().isoformat(),
         "excel_file_path": current_excel_path,
-        "file_exists": os.path.exists(current_excel_path)
+        "file_exists": os.path.exists(current_excel_path),
+        "dataset_version": dataset_version,
+        "reporting_validation": reporting_validation,
+        "hierarchy_audit": hierarchy_audit_status
     }
     
     return info
@@ -633,7 +2766,7 @@ async def upload_employee_image(emp_code: str, file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
 @app.get("/api/employees/{emp_code}/image")
-async def get_employee_image(emp_code: str):
+async def get_employee_image(request: Request, emp_code: str):
     """Get employee image"""
     # Check if employee exists
     employee = None
@@ -645,11 +2778,36 @@ async def get_employee_image(emp_code: str):
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
-    image_url = get_employee_image_from_db(emp_code)
-    if not image_url:
+    def build_payload():
+        image_url = get_employee_image_from_db(emp_code)
+        if not image_url:
+            raise HTTPException(status_code=404, detail="Image not found")
+        
+        return {"image_url": image_url}
+    
+    return conditional_read_response(request, build_payload)
+
+# Blobs never change once stored under their hash, so clients may keep them forever
+IMAGE_BLOB_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@app.get("/api/images/{image_hash}")
+async def get_image_blob(request: Request, image_hash: str):
+    """Get a stored photo by its SHA-256 content hash, cacheable as immutable"""
+    if image_blobs_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    
+    if not re.fullmatch(r'[0-9a-f]{64}', image_hash):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    headers = {"ETag": f'"{image_hash}"', "Cache-Control": IMAGE_BLOB_CACHE_CONTROL}
+    if etag_matches(request.headers.get('if-none-match'), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    
+    blob = image_blobs_collection.find_one({"_id": image_hash})
+    if not blob:
         raise HTTPException(status_code=404, detail="Image not found")
     
-    return {"image_url": image_url}
+    return Response(content=base64.b64decode(blob['image_data']), media_type=blob['image_type'], headers=headers)
 
 @app.delete("/api/employees/{emp_code}/image")
 async def delete_employee_image(emp_code: str):
@@ -670,6 +2828,420 @@ async def delete_employee_image(emp_code: str):
     
     return {"success": True, "message": "Image deleted successfully"}
 
+# Bulk photo import from a ZIP of files named by emp_code
+IMAGE_IMPORT_MAX_ZIP_MB = int(os.environ.get('IMAGE_IMPORT_MAX_ZIP_MB', '500'))
+IMAGE_IMPORT_MAX_DIMENSION = int(os.environ.get('IMAGE_IMPORT_MAX_DIMENSION', '512'))
+IMAGE_IMPORT_WORKERS = int(os.environ.get('IMAGE_IMPORT_WORKERS', str(min(4, os.cpu_count() or 1))))
+IMAGE_IMPORT_BATCH_SIZE = 50  # Entries decoded and written per bulk_write
+IMAGE_IMPORT_JOB_TTL_HOURS = int(os.environ.get('IMAGE_IMPORT_JOB_TTL_HOURS', '24'))  # How long job reports are kept
+IMAGE_CONTENT_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
+
+def image_import_expiry() -> datetime:
+    """When an import job's progress and report are dropped by the TTL indexes"""
+    return datetime.utcnow() + timedelta(hours=IMAGE_IMPORT_JOB_TTL_HOURS)
+
+def prepare_imported_image(file_name: str, file_content: bytes, rows: Dict[str, int], employees: List[Dict]) -> Dict:
+    """Validate one extracted photo and shrink it to IMAGE_IMPORT_MAX_DIMENSION (runs in the worker pool)"""
+    emp_code = normalize_emp_code(Path(file_name).stem)
+    row = rows.get(emp_code)
+    if row is None:
+        return {"file": file_name, "emp_code": emp_code, "status": "skipped", "message": "Employee not found"}
+    
+    is_valid, message = validate_image(file_content)
+    if not is_valid:
+        return {"file": file_name, "emp_code": emp_code, "status": "error", "message": message}
+    
+    try:
+        image = Image.open(io.BytesIO(file_content))
+        image_format = image.format
+        if max(image.size) > IMAGE_IMPORT_MAX_DIMENSION:
+            image.thumbnail((IMAGE_IMPORT_MAX_DIMENSION, IMAGE_IMPORT_MAX_DIMENSION))
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            output = io.BytesIO()
+            image.save(output, format=image_format)
+            file_content = output.getvalue()
+    except Exception as e:
+        return {"file": file_name, "emp_code": emp_code, "status": "error", "message": f"Error resizing image: {str(e)}"}
+    
+    return {
+        "file": file_name,
+        "emp_code": employees[row]['emp_code'],
+        "status": "imported",
+        "image_data": base64.b64encode(file_content).decode('utf-8'),
+        "image_type": IMAGE_CONTENT_TYPES[image_format]
+    }
+
+def run_image_import(job_id: str, zip_path: str, rows: Dict[str, int], employees: List[Dict]):
+    """Extract, validate, resize and store every photo of an uploaded ZIP against one employee snapshot
+    
+    Progress and the per-file report are kept in MongoDB so any worker can serve them.
+    """
+    max_bytes = 5 * 1024 * 1024
+    reported = 0
+    imported_count = 0
+    
+    def report(results: List[Dict]):
+        nonlocal reported
+        if not results:
+            return
+        counts = {}
+        for result in results:
+            counts[f"counts.{result['status']}"] = counts.get(f"counts.{result['status']}", 0) + 1
+        expire_at = image_import_expiry()
+        image_import_results_collection.insert_many([
+            {**result, "job_id": job_id, "index": reported + offset, "expire_at": expire_at}
+            for offset, result in enumerate(results)
+        ])
+        image_import_jobs_collection.update_one({"job_id": job_id}, {"$inc": counts})
+        reported += len(results)
+    
+    def flush(batch: List[tuple], executor: ThreadPoolExecutor):
+        nonlocal imported_count
+        results = list(executor.map(lambda entry: prepare_imported_image(*entry, rows, employees), batch))
+        imported = [result for result in results if result["status"] == "imported"]
+        try:
+            errors = save_employee_images_to_db([(result["emp_code"], result["image_data"], result["image_type"]) for result in imported])
+        except Exception as e:
+            errors = {result["emp_code"]: str(e) for result in imported}
+        for result in imported:
+            if errors.get(result["emp_code"]):
+                result["status"] = "error"
+                result["message"] = f"Failed to save image to database: {errors[result['emp_code']]}"
+            else:
+                imported_count += 1
+        for result in results:
+            result.pop("image_data", None)
+            result.pop("image_type", None)
+        report(results)
+    
+    update = {}
+    try:
+        image_import_jobs_collection.update_one({"job_id": job_id}, {"$set": {"state": "running"}})
+        with zipfile.ZipFile(zip_path) as archive, ThreadPoolExecutor(max_workers=IMAGE_IMPORT_WORKERS) as executor:
+            entries = [
+                info for info in archive.infolist()
+                if not info.is_dir() and not Path(info.filename).name.startswith('.') and '__MACOSX' not in info.filename
+            ]
+            image_import_jobs_collection.update_one({"job_id": job_id}, {"$set": {"total": len(entries)}})
+            
+            batch = []
+            for info in entries:
+                file_name = Path(info.filename).name
+                if info.file_size > max_bytes:
+                    report([{"file": file_name, "status": "error", "message": "File size too large. Maximum 5MB allowed."}])
+                    continue
+                with archive.open(info) as entry:
+                    batch.append((file_name, entry.read(max_bytes + 1)))
+                if len(batch) >= IMAGE_IMPORT_BATCH_SIZE:
+                    flush(batch, executor)
+                    batch = []
+            flush(batch, executor)
+        
+        update = {"state": "finished"}
+    except Exception as e:
+        print(f"Error importing images from ZIP: {e}")
+        update = {"state": "failed", "error": str(e)}
+    finally:
+        # Finished reports are kept for IMAGE_IMPORT_JOB_TTL_HOURS from now
+        expire_at = image_import_expiry()
+        try:
+            image_import_jobs_collection.update_one(
+                {"job_id": job_id},
+                {"$set": {**update, "finished_at": datetime.now().isoformat(), "expire_at": expire_at}}
+            )
+            image_import_results_collection.update_many({"job_id": job_id}, {"$set": {"expire_at": expire_at}})
+        except Exception as e:
+            print(f"Error recording the end of image import {job_id}: {e}")
+        if imported_count:
+            bump_images_version()
+        os.unlink(zip_path)
+
+@app.post("/api/employees/images/import")
+async def import_employee_images(file: UploadFile = File(...)):
+    """Start a background import of employee photos from a ZIP whose files are named by emp_code (e.g. 80002.jpg)"""
+    if images_collection is None or image_import_jobs_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    
+    # Spool the upload to disk so the background job can read it after the request ends
+    max_bytes = IMAGE_IMPORT_MAX_ZIP_MB * 1024 * 1024
+    written = 0
+    with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as spooled:
+        while chunk := await file.read(1024 * 1024):
+            written += len(chunk)
+            if written > max_bytes:
+                spooled.close()
+                os.unlink(spooled.name)
+                raise HTTPException(status_code=400, detail=f"ZIP too large. Maximum {IMAGE_IMPORT_MAX_ZIP_MB}MB allowed.")
+            spooled.write(chunk)
+    
+    if not zipfile.is_zipfile(spooled.name):
+        os.unlink(spooled.name)
+        raise HTTPException(status_code=400, detail="Upload must be a ZIP archive")
+    
+    job_id = str(uuid.uuid4())
+    image_import_jobs_collection.insert_one({
+        "job_id": job_id,
+        "state": "queued",
+        "file": file.filename,
+        "total": None,
+        "counts": {"imported": 0, "skipped": 0, "error": 0},
+        "error": None,
+        "started_at": datetime.now().isoformat(),
+        "finished_at": None,
+        "expire_at": image_import_expiry()
+    })
+    threading.Thread(target=run_image_import, args=(job_id, spooled.name, employee_rows, employees_data), daemon=True).start()
+    
+    return {"job_id": job_id, "state": "queued", "status_url": f"/api/employees/images/import/{job_id}"}
+
+@app.get("/api/employees/images/import/{job_id}")
+async def get_image_import_job(job_id: str):
+    """Get progress and the per-file report of a bulk photo import"""
+    if image_import_jobs_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    
+    job = image_import_jobs_collection.find_one({"job_id": job_id}, {"_id": 0, "expire_at": 0})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    results = image_import_results_collection.find({"job_id": job_id}, {"_id": 0, "job_id": 0, "index": 0, "expire_at": 0}).sort("index", 1)
+    return {**job, "results": list(results)}
+
+def compress_structure_blob(data: bytes, codec: str) -> bytes:
+    """Compress a serialized hierarchy structure with the given codec"""
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd codec requested but the zstandard package is not installed")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == 'zlib':
+        return zlib.compress(data, 6)
+    raise ValueError(f"Unknown hierarchy structure codec: {codec}")
+
+def decompress_structure_blob(blob: bytes, codec: str) -> bytes:
+    """Inverse of compress_structure_blob"""
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Hierarchy is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if codec == 'zlib':
+        return zlib.decompress(blob)
+    raise ValueError(f"Unknown hierarchy structure codec: {codec}")
+
+def serialize_structure(structure: Dict) -> bytes:
+    """Compact JSON of a structure (or of a side log of its nodes)"""
+    return json.dumps(structure, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+
+def encode_hierarchy_structure(structure: Dict) -> Dict:
+    """Document fields storing a structure, compressed with a codec marker above the size threshold"""
+    data = serialize_structure(structure)
+    if len(data) < HIERARCHY_COMPRESSION_THRESHOLD:
+        return {"structure": structure}
+    
+    return {
+        "structure_blob": compress_structure_blob(data, HIERARCHY_COMPRESSION_CODEC),
+        "structure_codec": HIERARCHY_COMPRESSION_CODEC
+    }
+
+def decode_hierarchy_structure(hierarchy_doc: Dict) -> Dict:
+    """Structure of a hierarchy document, whether stored inline or compressed
+    
+    A compressed structure is the blob plus its structure_delta side log: emp_code -> node,
+    or None for a node removed since the blob was written.
+    """
+    if hierarchy_doc.get("structure_blob") is not None:
+        data = decompress_structure_blob(bytes(hierarchy_doc["structure_blob"]), hierarchy_doc.get("structure_codec", "zlib"))
+        structure = json.loads(data)
+        for emp_code, node in (hierarchy_doc.get("structure_delta") or {}).items():
+            if node is None:
+                structure.pop(emp_code, None)
+            else:
+                structure[emp_code] = node
+        return structure
+    return hierarchy_doc.get("structure", {})
+
+def record_hierarchy_revision(
+    hierarchy_id: str,
+    revision: int,
+    name: str,
+    structure: Dict,
+    changed: Optional[Dict] = None,
+    removed: Optional[List[str]] = None
+):
+    """Append a revision to a hierarchy's history
+    
+    Every HIERARCHY_SNAPSHOT_INTERVAL revisions (and whenever the previous revision is
+    unknown) the full structure is stored; otherwise only the changed and removed nodes.
+    """
+    if hierarchy_revisions_collection is None:
+        return
+    
+    try:
+        record = {
+            "hierarchy_id": hierarchy_id,
+            "revision": revision,
+            "name": name,
+            "created_at": datetime.now().isoformat()
+        }
+        
+        has_previous = hierarchy_revisions_collection.find_one(
+            {"hierarchy_id": hierarchy_id, "revision": revision - 1}, {"_id": 1}
+        ) is not None
+        if changed is None or not has_previous or (revision - 1) % HIERARCHY_SNAPSHOT_INTERVAL == 0:
+            record["kind"] = "snapshot"
+            record["changed_count"] = len(structure)
+            record["removed_count"] = 0
+            record.update(encode_hierarchy_structure(structure))
+        else:
+            # Stored as a list since employee codes are not guaranteed to be valid field names
+            record["kind"] = "diff"
+            record["changed_count"] = len(changed)
+            record["removed_count"] = len(removed or [])
+            record["set"] = [{"emp_code": emp_code, "node": node} for emp_code, node in changed.items()]
+            record["unset"] = list(removed or [])
+        
+        hierarchy_revisions_collection.replace_one(
+            {"hierarchy_id": hierarchy_id, "revision": revision},
+            record,
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Error recording revision {revision} of hierarchy {hierarchy_id}: {e}")
+
+def structure_diff(old_structure: Dict, new_structure: Dict) -> tuple:
+    """Nodes added or changed, and emp_codes removed, going from one structure to another"""
+    changed = {emp_code: node for emp_code, node in new_structure.items() if old_structure.get(emp_code) != node}
+    removed = [emp_code for emp_code in old_structure if emp_code not in new_structure]
+    return changed, removed
+
+def materialize_hierarchy_revision(hierarchy_id: str, revision: int) -> Dict:
+    """Rebuild a past revision from the nearest snapshot at or before it plus the diffs after it"""
+    snapshot = hierarchy_revisions_collection.find_one(
+        {"hierarchy_id": hierarchy_id, "kind": "snapshot", "revision": {"$lte": revision}},
+        sort=[("revision", -1)]
+    )
+    if not snapshot:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    
+    structure = decode_hierarchy_structure(snapshot)
+    name = snapshot.get("name")
+    current = snapshot["revision"]
+    
+    diffs = hierarchy_revisions_collection.find(
+        {"hierarchy_id": hierarchy_id, "revision": {"$gt": current, "$lte": revision}}
+    ).sort("revision", 1)
+    for record in diffs:
+        if record["revision"] != current + 1:
+            raise HTTPException(status_code=500, detail=f"Revision history is missing revision {current + 1}")
+        for change in record.get("set", []):
+            structure[change["emp_code"]] = change["node"]
+        for emp_code in record.get("unset", []):
+            structure.pop(emp_code, None)
+        name = record.get("name", name)
+        current = record["revision"]
+    
+    if current != revision:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    
+    return {"hierarchy_id": hierarchy_id, "revision": revision, "name": name, "structure": structure}
+
+# Employee fields compared between a saved node and the live record to detect moves
+HIERARCHY_AUDIT_FIELDS = ['department', 'location', 'designation']
+
+def validate_hierarchy_structure(structure, rows: Dict[str, int], employees: List[Dict]) -> Dict:
+    """Check every node of a structure against the employee primary-key index in one pass
+    
+    Reports unknown employees, employees placed more than once, managers missing from the
+    structure, and nodes whose saved department/location/designation no longer match.
+    """
+    if not isinstance(structure, dict):
+        return {"valid": False, "node_count": 0, "error": "Structure must map emp_code to node"}
+    
+    unknown = []
+    duplicated = []
+    moved = []
+    missing_managers = []
+    seen = set()
+    keys = {normalize_emp_code(key) for key in structure}
+    
+    for key, node in structure.items():
+        node = node if isinstance(node, dict) else {}
+        emp_code = normalize_emp_code(node.get('emp_code') or key)
+        if emp_code in seen:
+            duplicated.append(emp_code)
+            continue
+        seen.add(emp_code)
+        
+        manager = node.get('manager')
+        if manager and normalize_emp_code(manager) not in keys:
+            missing_managers.append({"emp_code": emp_code, "manager": manager})
+        
+        row = rows.get(emp_code)
+        if row is None:
+            unknown.append(emp_code)
+            continue
+        
+        for field in HIERARCHY_AUDIT_FIELDS:
+            if field in node and node[field] != employees[row].get(field):
+                moved.append({"emp_code": emp_code, "field": field, "saved": node[field], "current": employees[row].get(field)})
+    
+    return {
+        "valid": not (unknown or duplicated or missing_managers),
+        "node_count": len(structure),
+        "unknown": unknown,
+        "duplicated": duplicated,
+        "missing_managers": missing_managers,
+        "moved": moved
+    }
+
+def hierarchy_audit_report(structure, rows: Dict[str, int], employees: List[Dict], version: str, revision: int) -> Dict:
+    """Validation report stamped with the employee snapshot and hierarchy revision it applies to"""
+    audit = validate_hierarchy_structure(structure, rows, employees)
+    audit["dataset_version"] = version
+    audit["revision"] = revision
+    audit["audited_at"] = datetime.now().isoformat()
+    return audit
+
+def audit_hierarchy_document(hierarchy_doc: Dict, rows: Dict[str, int], employees: List[Dict], version: str) -> Dict:
+    """Validate a stored hierarchy and cache the report on the document
+    
+    The report is only stored if the hierarchy is still at the revision that was audited.
+    """
+    audit = hierarchy_audit_report(decode_hierarchy_structure(hierarchy_doc), rows, employees, version, hierarchy_doc.get("revision", 0))
+    hierarchies_collection.update_one({"_id": hierarchy_doc["_id"], "revision": hierarchy_doc.get("revision")}, {"$set": {"audit": audit}})
+    return audit
+
+def run_hierarchy_audit(rows: Dict[str, int], employees: List[Dict], version: str):
+    """Audit every saved hierarchy against one employee snapshot, stopping if a newer snapshot loads"""
+    global hierarchy_audit_status
+    
+    hierarchy_audit_status = {"state": "running", "dataset_version": version, "audited": 0, "invalid": 0, "started_at": datetime.now().isoformat()}
+    try:
+        projection = {"hierarchy_id": 1, "revision": 1, "structure": 1, "structure_blob": 1, "structure_codec": 1, "structure_delta": 1}
+        for hierarchy_doc in hierarchies_collection.find({}, projection):
+            if version != dataset_version:
+                hierarchy_audit_status = {**hierarchy_audit_status, "state": "superseded"}
+                return
+            audit = audit_hierarchy_document(hierarchy_doc, rows, employees, version)
+            hierarchy_audit_status["audited"] += 1
+            if not audit["valid"]:
+                hierarchy_audit_status["invalid"] += 1
+        hierarchy_audit_status = {**hierarchy_audit_status, "state": "finished", "finished_at": datetime.now().isoformat()}
+    except Exception as e:
+        print(f"Error auditing saved hierarchies: {e}")
+        hierarchy_audit_status = {**hierarchy_audit_status, "state": "failed", "error": str(e)}
+
+def schedule_hierarchy_audit():
+    """Audit all saved hierarchies in the background against the snapshot just loaded"""
+    if hierarchies_collection is None:
+        return
+    
+    thread = threading.Thread(
+        target=run_hierarchy_audit,
+        args=(employee_rows, employees_data, dataset_version),
+        daemon=True
+    )
+    thread.start()
+
 @app.post("/api/hierarchy/save")
 async def save_hierarchy(hierarchy_data: dict):
     """Save hierarchy structure"""
@@ -681,49 +3253,124 @@ async def save_hierarchy(hierarchy_data: dict):
         hierarchy_name = hierarchy_data.get('name', 'Unnamed Hierarchy')
         structure = hierarchy_data.get('structure', {})
         
+        # Every write bumps the revision; like PATCH, a save only applies to the revision it was based on
+        existing = hierarchies_collection.find_one({"hierarchy_id": hierarchy_id})
+        current_revision = existing.get("revision", 0) if existing else 0
+        expected_revision = hierarchy_data.get('revision')
+        if expected_revision is not None and expected_revision != current_revision:
+            raise HTTPException(status_code=409, detail=f"Hierarchy is at revision {current_revision}, not {expected_revision}")
+        revision = current_revision + 1
+        
+        validation = hierarchy_audit_report(structure, employee_rows, employees_data, dataset_version, revision)
+        if hierarchy_data.get('strict') and not validation["valid"]:
+            raise HTTPException(status_code=400, detail={"message": "Hierarchy failed validation", "validation": validation})
+        
         hierarchy_doc = {
             "hierarchy_id": hierarchy_id,
             "name": hierarchy_name,
-            "structure": structure,
+            **encode_hierarchy_structure(structure),
+            "name_lower": hierarchy_name.lower(),
+            "node_count": len(structure) if isinstance(structure, dict) else 0,
+            "revision": revision,
+            "audit": validation,
             "created_at": datetime.now().isoformat(),
             "updated_at": datetime.now().isoformat()
         }
         
-        # Use upsert to replace existing hierarchy with same ID
-        result = hierarchies_collection.replace_one(
-            {"hierarchy_id": hierarchy_id},
-            hierarchy_doc,
-            upsert=True
-        )
+        # Replace only the revision that was read, so a PATCH landing in between is never overwritten
+        try:
+            if existing:
+                revision_filter = {"revision": current_revision} if current_revision else {"revision": {"$in": [0, None]}}
+                written = hierarchies_collection.replace_one({"hierarchy_id": hierarchy_id, **revision_filter}, hierarchy_doc).matched_count == 1
+            else:
+                hierarchies_collection.insert_one(hierarchy_doc)
+                written = True
+        except DuplicateKeyError:
+            written = False
+        if not written:
+            raise HTTPException(status_code=409, detail="Hierarchy was modified concurrently, reload and retry")
+        
+        if existing and isinstance(structure, dict):
+            previous_structure = decode_hierarchy_structure(existing)
+            if isinstance(previous_structure, dict):
+                changed, removed = structure_diff(previous_structure, structure)
+                record_hierarchy_revision(hierarchy_id, revision, hierarchy_name, structure, changed, removed)
+            else:
+                record_hierarchy_revision(hierarchy_id, revision, hierarchy_name, structure)
+        else:
+            record_hierarchy_revision(hierarchy_id, revision, hierarchy_name, structure)
         
         return {
             "success": True,
             "message": "Hierarchy saved successfully",
             "hierarchy_id": hierarchy_id,
-            "name": hierarchy_name
+            "name": hierarchy_name,
+            "revision": revision,
+            "validation": validation
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving hierarchy: {str(e)}")
 
+# Page size bounds for the saved hierarchy list
+HIERARCHY_LIST_DEFAULT_LIMIT = 50
+HIERARCHY_LIST_MAX_LIMIT = 200
+
+def encode_list_cursor(updated_at: str, hierarchy_id: str) -> str:
+    """Opaque cursor pointing just after a listed hierarchy"""
+    return base64.urlsafe_b64encode(json.dumps([updated_at, hierarchy_id]).encode('utf-8')).decode('ascii')
+
+def decode_list_cursor(cursor: str) -> tuple:
+    """Inverse of encode_list_cursor"""
+    try:
+        updated_at, hierarchy_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return updated_at, hierarchy_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/api/hierarchy/list")
-async def get_saved_hierarchies():
-    """Get all saved hierarchies"""
+async def get_saved_hierarchies(limit: int = HIERARCHY_LIST_DEFAULT_LIMIT, cursor: str = "", q: str = ""):
+    """Get saved hierarchies, most recently updated first, page by page
+    
+    q filters by case-insensitive name prefix; pass next_cursor back as cursor for the next page.
+    """
     if hierarchies_collection is None:
         raise HTTPException(status_code=500, detail="Database connection not available")
     
+    limit = max(1, min(limit, HIERARCHY_LIST_MAX_LIMIT))
+    query = {}
+    if q:
+        query["name_lower"] = {"$regex": "^" + re.escape(q.lower())}
+    if cursor:
+        updated_at, hierarchy_id = decode_list_cursor(cursor)
+        query["$or"] = [
+            {"updated_at": {"$lt": updated_at}},
+            {"updated_at": updated_at, "hierarchy_id": {"$lt": hierarchy_id}}
+        ]
+    
     try:
         hierarchies = []
-        for doc in hierarchies_collection.find({}, {"structure": 0}):  # Exclude structure data for list view
+        projection = {"hierarchy_id": 1, "name": 1, "node_count": 1, "revision": 1, "created_at": 1, "updated_at": 1}  # Never load structure data for list view
+        documents = hierarchies_collection.find(query, projection).sort([("updated_at", -1), ("hierarchy_id", -1)]).limit(limit + 1)
+        for doc in documents:
             hierarchy = {
                 "hierarchy_id": doc.get("hierarchy_id"),
                 "name": doc.get("name"),
+                "node_count": doc.get("node_count"),
+                "revision": doc.get("revision", 0),
                 "created_at": doc.get("created_at"),
                 "updated_at": doc.get("updated_at")
             }
             hierarchies.append(hierarchy)
         
-        return {"hierarchies": hierarchies}
+        next_cursor = None
+        if len(hierarchies) > limit:
+            hierarchies = hierarchies[:limit]
+            next_cursor = encode_list_cursor(hierarchies[-1]["updated_at"], hierarchies[-1]["hierarchy_id"])
+        
+        return {"hierarchies": hierarchies, "next_cursor": next_cursor}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching hierarchies: {str(e)}")
@@ -743,7 +3390,8 @@ async def get_hierarchy(hierarchy_id: str):
         hierarchy = {
             "hierarchy_id": hierarchy_doc.get("hierarchy_id"),
             "name": hierarchy_doc.get("name"),
-            "structure": hierarchy_doc.get("structure", {}),
+            "structure": decode_hierarchy_structure(hierarchy_doc),
+            "revision": hierarchy_doc.get("revision", 0),
             "created_at": hierarchy_doc.get("created_at"),
             "updated_at": hierarchy_doc.get("updated_at")
         }
@@ -755,6 +3403,366 @@ async def get_hierarchy(hierarchy_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching hierarchy: {str(e)}")
 
+def validate_structure_key(emp_code) -> str:
+    """Employee codes are used as field names inside the stored structure"""
+    if not isinstance(emp_code, str) or not emp_code or '.' in emp_code or emp_code.startswith('$'):
+        raise HTTPException(status_code=400, detail=f"Invalid emp_code: {emp_code!r}")
+    return emp_code
+
+def apply_hierarchy_operations(structure: Dict, operations: List[Dict]) -> tuple:
+    """Apply node operations to a structure in place
+    
+    Supported operations:
+        {"op": "move", "emp_code": ..., "manager": ... or null}
+        {"op": "add", "emp_code": ..., "manager": ..., "node": {...}}
+        {"op": "remove", "emp_code": ...}  (its reports lose their manager)
+        {"op": "rename", "name": ...}  (hierarchy name) or with "emp_code" (node label)
+    
+    Returns (changed emp_codes, removed emp_codes, new hierarchy name or None).
+    """
+    changed = set()
+    removed = set()
+    new_name = None
+    
+    def set_manager(emp_code: str, manager: Optional[str]):
+        node = structure[emp_code]
+        if manager is None:
+            node.pop('manager', None)
+            node.pop('managerName', None)
+            return
+        
+        if manager not in structure:
+            raise HTTPException(status_code=400, detail=f"Manager {manager} is not in the hierarchy")
+        # Reject moves that would make a node report to its own subtree
+        ancestor = manager
+        for _ in range(len(structure)):
+            if ancestor is None:
+                break
+            if ancestor == emp_code:
+                raise HTTPException(status_code=400, detail=f"Moving {emp_code} under {manager} would create a cycle")
+            ancestor = structure.get(ancestor, {}).get('manager')
+        node['manager'] = manager
+        node['managerName'] = structure[manager].get('emp_name', '')
+    
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise HTTPException(status_code=400, detail="Each operation must be an object")
+        op = operation.get('op')
+        
+        if op == 'rename' and operation.get('emp_code') is None:
+            new_name = str(operation.get('name') or '')
+            if not new_name:
+                raise HTTPException(status_code=400, detail="rename requires a name")
+            continue
+        
+        emp_code = validate_structure_key(operation.get('emp_code'))
+        manager = operation.get('manager')
+        if manager is not None:
+            manager = validate_structure_key(manager)
+        
+        if op == 'add':
+            if emp_code in structure:
+                raise HTTPException(status_code=400, detail=f"Employee {emp_code} is already in the hierarchy")
+            node = operation.get('node')
+            if node is None:
+                row = employee_rows.get(normalize_emp_code(emp_code))
+                node = dict(employees_data[row]) if row is not None else {"emp_code": emp_code}
+            if not isinstance(node, dict):
+                raise HTTPException(status_code=400, detail="add requires node to be an object")
+            structure[emp_code] = dict(node)
+            set_manager(emp_code, manager)
+            changed.add(emp_code)
+            removed.discard(emp_code)
+        elif emp_code not in structure:
+            raise HTTPException(status_code=404, detail=f"Employee {emp_code} is not in the hierarchy")
+        elif op == 'move':
+            set_manager(emp_code, manager)
+            changed.add(emp_code)
+        elif op == 'remove':
+            del structure[emp_code]
+            changed.discard(emp_code)
+            removed.add(emp_code)
+            for other_code, node in structure.items():
+                if isinstance(node, dict) and node.get('manager') == emp_code:
+                    set_manager(other_code, None)
+                    changed.add(other_code)
+        elif op == 'rename':
+            label = str(operation.get('name') or '')
+            if not label:
+                raise HTTPException(status_code=400, detail="rename requires a name")
+            structure[emp_code]['label'] = label
+            changed.add(emp_code)
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown operation: {op!r}")
+    
+    return changed, removed, new_name
+
+@app.patch("/api/hierarchy/{hierarchy_id}")
+async def patch_hierarchy(hierarchy_id: str, patch_data: dict):
+    """Apply node operations to a saved hierarchy: {"revision": n, "operations": [...]}
+    
+    Only the touched nodes are written, in one atomic update that fails with 409
+    if the hierarchy changed since the client's revision.
+    """
+    if hierarchies_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    
+    revision = patch_data.get('revision')
+    operations = patch_data.get('operations')
+    if not isinstance(revision, int) or not isinstance(operations, list):
+        raise HTTPException(status_code=400, detail="Provide an integer 'revision' and a list of 'operations'")
+    
+    try:
+        hierarchy_doc = hierarchies_collection.find_one({"hierarchy_id": hierarchy_id})
+        if not hierarchy_doc:
+            raise HTTPException(status_code=404, detail="Hierarchy not found")
+        if hierarchy_doc.get("revision", 0) != revision:
+            raise HTTPException(status_code=409, detail=f"Hierarchy is at revision {hierarchy_doc.get('revision', 0)}, not {revision}")
+        
+        structure = decode_hierarchy_structure(hierarchy_doc)
+        if not isinstance(structure, dict):
+            raise HTTPException(status_code=400, detail="Hierarchy structure must map emp_code to node")
+        changed, removed, new_name = apply_hierarchy_operations(structure, operations)
+        
+        # The stored audit follows the structure, so it is redone for the new revision
+        audit = hierarchy_audit_report(structure, employee_rows, employees_data, dataset_version, revision + 1)
+        if patch_data.get('strict') and not audit["valid"]:
+            raise HTTPException(status_code=400, detail={"message": "Hierarchy failed validation", "validation": audit})
+        
+        update = {
+            "$set": {"updated_at": datetime.now().isoformat(), "node_count": len(structure), "audit": audit},
+            "$inc": {"revision": 1}
+        }
+        if hierarchy_doc.get("structure_blob") is not None:
+            delta = dict(hierarchy_doc.get("structure_delta") or {})
+            delta.update({emp_code: structure[emp_code] for emp_code in changed})
+            delta.update({emp_code: None for emp_code in removed})
+            if len(serialize_structure(delta)) <= HIERARCHY_DELTA_MAX_BYTES:
+                # Touched nodes go to the side log, so the blob is not rewritten on every edit
+                for emp_code in changed:
+                    update["$set"][f"structure_delta.{emp_code}"] = structure[emp_code]
+                for emp_code in removed:
+                    update["$set"][f"structure_delta.{emp_code}"] = None
+            else:
+                # The side log is full: fold it into a freshly encoded structure
+                encoded = encode_hierarchy_structure(structure)
+                update["$set"].update(encoded)
+                update["$unset"] = {"structure_delta": ""}
+                if "structure" in encoded:
+                    update["$unset"].update({"structure_blob": "", "structure_codec": ""})
+        elif len(serialize_structure(structure)) >= HIERARCHY_COMPRESSION_THRESHOLD:
+            # Grown past the threshold: stored compressed from now on
+            update["$set"].update(encode_hierarchy_structure(structure))
+            update["$unset"] = {"structure": ""}
+        else:
+            for emp_code in changed:
+                update["$set"][f"structure.{emp_code}"] = structure[emp_code]
+            if removed:
+                update["$unset"] = {f"structure.{emp_code}": "" for emp_code in removed}
+        if new_name is not None:
+            update["$set"]["name"] = new_name
+            update["$set"]["name_lower"] = new_name.lower()
+        
+        # Documents saved before revisions existed have no revision field
+        revision_filter = {"revision": revision} if revision else {"revision": {"$in": [0, None]}}
+        result = hierarchies_collection.update_one({"hierarchy_id": hierarchy_id, **revision_filter}, update)
+        if result.matched_count == 0:
+            raise HTTPException(status_code=409, detail="Hierarchy was modified concurrently, reload and retry")
+        
+        record_hierarchy_revision(
+            hierarchy_id,
+            revision + 1,
+            new_name if new_name is not None else hierarchy_doc.get("name"),
+            structure,
+            {emp_code: structure[emp_code] for emp_code in changed},
+            list(removed)
+        )
+        
+        return {
+            "success": True,
+            "message": "Hierarchy updated successfully",
+            "hierarchy_id": hierarchy_id,
+            "revision": revision + 1,
+            "changed": len(changed),
+            "removed": len(removed),
+            "validation": audit
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating hierarchy: {str(e)}")
+
+@app.get("/api/hierarchy/audit/status")
+async def get_hierarchy_audit_status():
+    """Get progress of the background audit of saved hierarchies"""
+    return hierarchy_audit_status
+
+@app.get("/api/hierarchy/{hierarchy_id}/audit")
+async def get_hierarchy_audit(hierarchy_id: str, refresh: bool = False):
+    """Get the audit of a saved hierarchy against the current employee data
+    
+    The stored report is returned when it matches both the loaded dataset version and the
+    hierarchy's revision; otherwise (or with refresh=true) the hierarchy is audited now.
+    """
+    if hierarchies_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    
+    try:
+        hierarchy_doc = hierarchies_collection.find_one({"hierarchy_id": hierarchy_id}, {"audit": 1, "revision": 1})
+        if not hierarchy_doc:
+            raise HTTPException(status_code=404, detail="Hierarchy not found")
+        
+        audit = hierarchy_doc.get("audit")
+        if (
+            refresh or not audit
+            or audit.get("dataset_version") != dataset_version
+            or audit.get("revision") != hierarchy_doc.get("revision", 0)
+        ):
+            hierarchy_doc = hierarchies_collection.find_one({"hierarchy_id": hierarchy_id})
+            audit = audit_hierarchy_document(hierarchy_doc, employee_rows, employees_data, dataset_version)
+        
+        return {"hierarchy_id": hierarchy_id, "audit": audit}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error auditing hierarchy: {str(e)}")
+
+def reporting_tree_diff(structure: Dict, root_row: Optional[int] = None) -> Dict:
+    """Structural diff of a saved structure against the live reporting_id tree, hashed by emp_code
+    
+    The live side is the subtree of root_row, or by default the union of the live subtrees
+    under the structure's top-level nodes. Managers outside that scope count as no manager.
+    """
+    draft_managers = {}
+    for key, node in structure.items():
+        node = node if isinstance(node, dict) else {}
+        draft_managers[normalize_emp_code(node.get('emp_code') or key)] = normalize_emp_code(node.get('manager')) or None
+    for code, manager in draft_managers.items():
+        if manager not in draft_managers:
+            draft_managers[code] = None
+    
+    if root_row is not None:
+        scope_roots = [root_row]
+    else:
+        scope_roots = [employee_rows[code] for code, manager in draft_managers.items() if manager is None and code in employee_rows]
+    
+    live_rows = set()
+    for row in scope_roots:
+        if row not in live_rows:
+            live_rows.update(org_preorder[org_tin[row]:org_tout[row]])
+    
+    live_managers = {}
+    for row in live_rows:
+        parent = org_parent[row]
+        live_managers[employees_data[row]['emp_code']] = employees_data[parent]['emp_code'] if parent in live_rows else None
+    
+    added = [{"emp_code": code, "manager": manager} for code, manager in draft_managers.items() if code not in live_managers]
+    removed = [{"emp_code": code, "manager": manager} for code, manager in live_managers.items() if code not in draft_managers]
+    moved = [
+        {"emp_code": code, "from_manager": live_managers[code], "to_manager": manager}
+        for code, manager in draft_managers.items()
+        if code in live_managers and live_managers[code] != manager
+    ]
+    
+    # Managers whose set of direct reports differs between the two trees
+    gained = {}
+    lost = {}
+    for entry in moved + added:
+        manager = entry.get("to_manager", entry.get("manager"))
+        if manager:
+            gained.setdefault(manager, []).append(entry["emp_code"])
+    for entry in moved + removed:
+        manager = entry.get("from_manager", entry.get("manager"))
+        if manager:
+            lost.setdefault(manager, []).append(entry["emp_code"])
+    changed_managers = [
+        {"emp_code": manager, "gained": gained.get(manager, []), "lost": lost.get(manager, [])}
+        for manager in sorted(set(gained) | set(lost))
+    ]
+    
+    return {
+        "scope_roots": [employees_data[row]['emp_code'] for row in scope_roots],
+        "draft_count": len(draft_managers),
+        "live_count": len(live_managers),
+        "unchanged_count": len(draft_managers) - len(added) - len(moved),
+        "added": added,
+        "removed": removed,
+        "moved": moved,
+        "changed_managers": changed_managers
+    }
+
+@app.get("/api/hierarchy/{hierarchy_id}/diff")
+async def get_hierarchy_diff(request: Request, hierarchy_id: str, root: str = ""):
+    """Diff a saved hierarchy against the official reporting lines from REPORTING ID
+    
+    Reports added, removed and moved employees plus the managers whose direct reports changed.
+    Pass root to compare against a specific employee's live subtree.
+    """
+    if hierarchies_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    
+    root_row = get_employee_row(root) if root else None
+    
+    hierarchy_meta = hierarchies_collection.find_one({"hierarchy_id": hierarchy_id}, {"updated_at": 1})
+    if not hierarchy_meta:
+        raise HTTPException(status_code=404, detail="Hierarchy not found")
+    
+    def build_payload():
+        hierarchy_doc = hierarchies_collection.find_one({"hierarchy_id": hierarchy_id})
+        if not hierarchy_doc:
+            raise HTTPException(status_code=404, detail="Hierarchy not found")
+        structure = decode_hierarchy_structure(hierarchy_doc)
+        if not isinstance(structure, dict):
+            raise HTTPException(status_code=400, detail="Hierarchy structure must map emp_code to node")
+        return {"hierarchy_id": hierarchy_id, "revision": hierarchy_doc.get("revision"), **reporting_tree_diff(structure, root_row)}
+    
+    version_scope = hashlib.sha256(str(hierarchy_meta.get("updated_at")).encode('utf-8')).hexdigest()[:8]
+    cache_params = {"hierarchy_id": hierarchy_id, "root": employees_data[root_row]['emp_code'] if root else ""}
+    return conditional_read_response(request, build_payload, cache_params, version_scope)
+
+@app.get("/api/hierarchy/{hierarchy_id}/revisions")
+async def get_hierarchy_revisions(hierarchy_id: str, limit: int = 50):
+    """List the revisions of a hierarchy, newest first"""
+    if hierarchy_revisions_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    
+    try:
+        revisions = []
+        cursor = hierarchy_revisions_collection.find(
+            {"hierarchy_id": hierarchy_id},
+            {"revision": 1, "kind": 1, "name": 1, "created_at": 1, "changed_count": 1, "removed_count": 1}
+        ).sort("revision", -1).limit(max(1, min(limit, 500)))
+        for doc in cursor:
+            revisions.append({
+                "revision": doc.get("revision"),
+                "kind": doc.get("kind"),
+                "name": doc.get("name"),
+                "created_at": doc.get("created_at"),
+                "changed_count": doc.get("changed_count", 0),
+                "removed_count": doc.get("removed_count", 0)
+            })
+        
+        return {"hierarchy_id": hierarchy_id, "revisions": revisions}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching revisions: {str(e)}")
+
+@app.get("/api/hierarchy/{hierarchy_id}/revisions/{revision}")
+async def get_hierarchy_revision(hierarchy_id: str, revision: int):
+    """Get the structure of a hierarchy as it was at a given revision"""
+    if hierarchy_revisions_collection is None:
+        raise HTTPException(status_code=500, detail="Database connection not available")
+    
+    try:
+        return materialize_hierarchy_revision(hierarchy_id, revision)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching revision: {str(e)}")
+
 @app.delete("/api/hierarchy/{hierarchy_id}")
 async def delete_hierarchy(hierarchy_id: str):
     """Delete hierarchy by ID"""
@@ -767,6 +3775,9 @@ async def delete_hierarchy(hierarchy_id: str):
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Hierarchy not found")
         
+        if hierarchy_revisions_collection is not None:
+            hierarchy_revisions_collection.delete_many({"hierarchy_id": hierarchy_id})
+        
         return {"success": True, "message": "Hierarchy deleted successfully"}
         
     except HTTPException:
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark compression of saved hierarchy structures
+Reports compression ratio and encode/decode cost for each available codec
+at 1k, 10k and 50k nodes, using nodes shaped like the ones HierarchyBuilder saves
+"""
+
+import os
+import sys
+import json
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from server import compress_structure_blob, decompress_structure_blob, zstandard
+
+NODE_COUNTS = [1000, 10000, 50000]
+REPEATS = 5
+
+DEPARTMENTS = ['Sales', 'Marketing', 'Finance & Accounts', 'Human Resources', 'CRM', 'Administration', 'Project Management']
+LOCATIONS = ['IFC', '62 Sales Gallery', 'PMO 75', 'Central Office 65', 'Noida Site']
+FIRST_NAMES = ['Vikas', 'Jyotsna', 'Pallav', 'Ashish', 'Amit', 'Rajat', 'Arpit', 'Yashpal', 'Hari', 'Anil']
+LAST_NAMES = ['Malhotra', 'Chauhan', 'Saxena', 'Jerath', 'Sharma', 'Jain', 'Bansal', 'Yadav', 'Gupta', 'Mittal']
+
+def build_structure(node_count):
+    """Build a random hierarchy structure with the given number of nodes"""
+    rng = random.Random(node_count)
+    structure = {}
+    codes = []
+
+    for index in range(node_count):
+        code = str(80000 + index)
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        node = {
+            "emp_code": code,
+            "emp_name": f"{first_name} {last_name}",
+            "department": rng.choice(DEPARTMENTS),
+            "location": rng.choice(LOCATIONS),
+            "designation": f"Manager - {rng.choice(DEPARTMENTS)}",
+            "mobile": str(rng.randint(9000000000, 9999999999)),
+            "extension_number": str(rng.randint(1000, 9999)),
+            "email": f"{first_name.lower()}.{last_name.lower()}{index}@smartworlddevelopers.com"
+        }
+        if codes:
+            manager = rng.choice(codes[-50:])
+            node["manager"] = manager
+            node["managerName"] = structure[manager]["emp_name"]
+        structure[code] = node
+        codes.append(code)
+
+    return structure
+
+def time_call(function, *args):
+    """Best wall-clock time in milliseconds over REPEATS calls"""
+    best = None
+    result = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    codecs = ['zlib'] + (['zstd'] if zstandard else [])
+
+    print(f"{'nodes':>7} {'codec':>6} {'raw KB':>9} {'stored KB':>10} {'ratio':>7} {'encode ms':>10} {'decode ms':>10}")
+    for node_count in NODE_COUNTS:
+        structure = build_structure(node_count)
+
+        for codec in codecs:
+            def encode():
+                data = json.dumps(structure, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+                return data, compress_structure_blob(data, codec)
+
+            encode_ms, (data, blob) = time_call(encode)
+            decode_ms, decoded = time_call(lambda: json.loads(decompress_structure_blob(blob, codec)))
+            assert decoded == structure
+
+            print(
+                f"{node_count:>7} {codec:>6} {len(data) / 1024:>9.1f} {len(blob) / 1024:>10.1f} "
+                f"{len(data) / len(blob):>7.2f} {encode_ms:>10.2f} {decode_ms:>10.2f}"
+            )
+
+    if not zstandard:
+        print("zstandard is not installed; only zlib was measured")
+
+if __name__ == "__main__":
+    main()
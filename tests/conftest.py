@@ -0,0 +1,29 @@
+import os
+import sys
+
+import mongomock
+import pymongo
+import pytest
+
+# server connects at import time, so the in-memory client must be in place first
+pymongo.MongoClient = mongomock.MongoClient
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import server as server_module  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    """The backend module with empty collections and per-process caches reset"""
+    for name in server_module.db.list_collection_names():
+        server_module.db.drop_collection(name)
+
+    server_module.response_cache.entries.clear()
+    server_module.response_cache.total_bytes = 0
+    server_module.attendance_slots = {}
+    server_module.attendance_day_cache.clear()
+    server_module.attendance_store_failed_at = 0.0
+    server_module.attendance_slots_checked_at = 0.0
+    server_module.images_version = 0
+    server_module.images_version_checked_at = 0.0
+    return server_module
@@ -0,0 +1,14 @@
+def make_employee(emp_code, reporting_id="", department="Sales", location="IFC", **fields):
+    """Employee record shaped like the rows loaded from the Excel sheet"""
+    return {
+        "emp_code": str(emp_code),
+        "emp_name": f"Employee {emp_code}",
+        "department": department,
+        "location": location,
+        "designation": "Manager",
+        "mobile": "",
+        "extension_number": "",
+        "email": "",
+        "reporting_id": str(reporting_id) if reporting_id != "" else "",
+        **fields
+    }
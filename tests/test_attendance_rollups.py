@@ -0,0 +1,108 @@
+import random
+from collections import Counter
+
+from fastapi.testclient import TestClient
+
+from tests.helpers import make_employee
+
+DEPARTMENTS = ["Finance", "Sales", "CRM"]
+LOCATIONS = ["IFC", "Noida"]
+
+
+def load_employees(server, count=40):
+    employees = [
+        make_employee(6000 + index, department=DEPARTMENTS[index % 3], location=LOCATIONS[index % 2])
+        for index in range(count)
+    ]
+    server.set_employees_data(employees)
+    return employees
+
+
+def rollup_counts(client, period, date):
+    """(department, location) -> counts served by the rollup endpoint"""
+    groups = client.get("/api/attendance/rollups", params={"period": period, "date": date}).json()["groups"]
+    return {(group["department"], group["location"]): group["counts"] for group in groups}
+
+
+def naive_counts(recorded, groups, dates):
+    """Counts per group recomputed from every record of the given dates"""
+    counts = {}
+    for (emp_code, date), status in recorded.items():
+        if date in dates:
+            group_counts = counts.setdefault(groups[(emp_code, date)], Counter())
+            group_counts[status] += 1
+            group_counts["recorded"] += 1
+    return counts
+
+
+def assert_matches(served, expected, server):
+    assert set(served) == set(expected)
+    for group, counts in expected.items():
+        for status, field in server.ATTENDANCE_STATUS_FIELDS.items():
+            assert served[group][field] == counts[status]
+        assert served[group]["recorded"] == counts["recorded"]
+
+
+def test_rollups_match_recounts_after_rewrites(server):
+    employees = load_employees(server)
+    client = TestClient(server.app)
+    rng = random.Random(47)
+    recorded = {}
+    groups = {}
+
+    # Several passes over the same days so statuses are overwritten, not only added
+    dates = ["2026-09-28", "2026-09-30", "2026-10-01", "2026-10-02", "2026-10-05"]
+    for _ in range(3):
+        for date in dates:
+            records = []
+            for emp in rng.sample(employees, 25):
+                status = rng.choice(server.ATTENDANCE_STATUSES)
+                recorded[(emp["emp_code"], date)] = status
+                groups[(emp["emp_code"], date)] = (emp["department"], emp["location"])
+                records.append({"emp_code": emp["emp_code"], "status": status})
+            assert client.post("/api/attendance/records", json={"date": date, "records": records}).status_code == 200
+
+    assert_matches(rollup_counts(client, "day", "2026-10-01"), naive_counts(recorded, groups, {"2026-10-01"}), server)
+    week = {"2026-09-28", "2026-09-30", "2026-10-01", "2026-10-02"}
+    assert_matches(rollup_counts(client, "week", "2026-10-01"), naive_counts(recorded, groups, week), server)
+    month = {"2026-10-01", "2026-10-02", "2026-10-05"}
+    assert_matches(rollup_counts(client, "month", "2026-10-20"), naive_counts(recorded, groups, month), server)
+
+
+def test_rewrite_after_department_change_moves_the_record(server):
+    employees = load_employees(server, 3)
+    client = TestClient(server.app)
+    emp_code = employees[2]["emp_code"]
+
+    client.post("/api/attendance/records", json={"date": "2026-10-14", "records": [{"emp_code": emp_code, "status": "Absent"}]})
+    moved = [dict(emp) for emp in employees]
+    moved[2]["department"] = "NEWDEPT"
+    server.set_employees_data(moved)
+    client.post("/api/attendance/records", json={"date": "2026-10-14", "records": [{"emp_code": emp_code, "status": "Present"}]})
+
+    for period in ("day", "week", "month"):
+        served = rollup_counts(client, period, "2026-10-14")
+        assert ("CRM", "IFC") not in served
+        assert served[("NEWDEPT", "IFC")]["present"] == 1
+        assert served[("NEWDEPT", "IFC")]["absent"] == 0
+
+
+def test_failed_rollup_write_is_repaired_by_a_retry(server, monkeypatch):
+    employees = load_employees(server, 3)
+    client = TestClient(server.app, raise_server_exceptions=False)
+    records = [{"emp_code": emp["emp_code"], "status": "Absent"} for emp in employees]
+
+    bulk_write = server.attendance_rollups_collection.bulk_write
+
+    def failing_bulk_write(*args, **kwargs):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(server.attendance_rollups_collection, "bulk_write", failing_bulk_write)
+    assert client.post("/api/attendance/records", json={"date": "2026-10-14", "records": records}).status_code == 500
+
+    monkeypatch.setattr(server.attendance_rollups_collection, "bulk_write", bulk_write)
+    assert client.post("/api/attendance/records", json={"date": "2026-10-14", "records": records}).status_code == 200
+
+    totals = client.get("/api/attendance/rollups", params={"period": "month", "date": "2026-10-14"}).json()["totals"]
+    assert totals["counts"]["absent"] == 3
+    assert totals["attendance_rate"] == 0.0
@@ -0,0 +1,164 @@
+import random
+from array import array
+
+from fastapi.testclient import TestClient
+
+from tests.helpers import make_employee
+
+
+def load_employees(server, count=60):
+    departments = ["Finance", "Sales", "CRM"]
+    employees = [make_employee(5000 + index, department=departments[index % 3]) for index in range(count)]
+    server.set_employees_data(employees)
+    return employees
+
+
+def test_uint16_arrays_round_trip_and_pad(server):
+    values = array('H', [0, 1, 540, 1439, server.ATTENDANCE_NO_TIME])
+    packed = server.pack_uint16(values)
+
+    assert len(packed) == 2 * len(values)
+    assert server.unpack_uint16(packed, 8).tolist() == values.tolist() + [server.ATTENDANCE_NO_TIME] * 3
+    assert server.unpack_uint16(None, 2).tolist() == [server.ATTENDANCE_NO_TIME] * 2
+
+
+def test_day_document_round_trip(server):
+    rng = random.Random(46)
+    size = 77
+    day = {
+        "date": "2026-10-12",
+        "revision": 3,
+        "slot_count": size,
+        "statuses": {status: 0 for status in server.ATTENDANCE_STATUSES},
+        "check_in": array('H', [server.ATTENDANCE_NO_TIME] * size),
+        "check_out": array('H', [server.ATTENDANCE_NO_TIME] * size),
+        "groups": [("Finance", "IFC"), ("Sales", "Noida")],
+        "slot_groups": array('H', [server.ATTENDANCE_NO_GROUP] * size)
+    }
+    for slot in rng.sample(range(size), 40):
+        day["statuses"][rng.choice(server.ATTENDANCE_STATUSES)] |= 1 << slot
+        day["check_in"][slot] = rng.randrange(1440)
+        day["slot_groups"][slot] = rng.randrange(2)
+
+    decoded = server.decode_attendance_day(server.encode_attendance_day(day), day["date"])
+    for key in ("revision", "slot_count", "statuses", "groups"):
+        assert decoded[key] == day[key]
+    for key in ("check_in", "check_out", "slot_groups"):
+        assert decoded[key].tolist() == day[key].tolist()
+
+
+def test_slot_assignment_is_stable_and_unique(server):
+    first = server.assign_attendance_slots(["a", "b", "c"])
+    assert sorted(first.values()) == [0, 1, 2]
+
+    # Another worker assigned "d" in the meantime; its slot is reused, not reassigned
+    server.counters_collection.update_one({"_id": "attendance_slot"}, {"$inc": {"next": 1}})
+    server.attendance_slots_collection.insert_one({"emp_code": "d", "slot": 3})
+
+    second = server.assign_attendance_slots(["c", "d", "e", "e"])
+    assert second["c"] == first["c"]
+    assert second["d"] == 3
+    assert second["e"] == 4
+    assert len(set(server.attendance_slots.values())) == len(server.attendance_slots)
+
+
+def test_range_query_matches_naive_scan(server):
+    employees = load_employees(server)
+    client = TestClient(server.app)
+    rng = random.Random(460)
+    recorded = {}
+
+    for day in range(10, 17):
+        date = f"2026-10-{day}"
+        records = []
+        for emp in rng.sample(employees, 45):
+            status = rng.choice(server.ATTENDANCE_STATUSES)
+            recorded[(emp["emp_code"], date)] = status
+            records.append({"emp_code": emp["emp_code"], "status": status, "check_in": "09:05"})
+        assert client.post("/api/attendance/records", json={"date": date, "records": records}).status_code == 200
+
+    response = client.get("/api/attendance/range", params={"start": "2026-10-12", "end": "2026-10-16", "department": "finance"})
+    result = {emp["emp_code"]: emp["dates"] for emp in response.json()["employees"]}
+
+    expected = {}
+    for (emp_code, date), status in sorted(recorded.items(), key=lambda item: item[0][1]):
+        emp = employees[int(emp_code) - 5000]
+        if status == "Absent" and emp["department"] == "Finance" and "2026-10-12" <= date <= "2026-10-16":
+            expected.setdefault(emp_code, []).append(date)
+    assert result == expected
+
+
+def test_record_retries_after_a_concurrent_write(server, monkeypatch):
+    employees = load_employees(server, 3)
+    slots = server.assign_attendance_slots([emp["emp_code"] for emp in employees])
+    group = ("Finance", "IFC")
+    server.record_attendance_day("2026-10-12", [(slots["5000"], "Present", 540, 1080, group)])
+
+    # Another worker commits between this write's read and its conditional replace
+    collection = server.attendance_days_collection
+    replace_one = collection.replace_one
+    calls = []
+
+    def replace_after_concurrent_write(query, doc, *args, **kwargs):
+        if not calls:
+            collection.update_one({"date": "2026-10-12"}, {"$inc": {"revision": 1}})
+        calls.append(query["revision"])
+        return replace_one(query, doc, *args, **kwargs)
+
+    monkeypatch.setattr(collection, "replace_one", replace_after_concurrent_write)
+    day = server.record_attendance_day("2026-10-12", [(slots["5001"], "Late", 600, 1080, group)])
+
+    assert calls == [1, 2]
+    assert day["revision"] == 3
+    assert [server.slot_attendance_status(day, slots[code]) for code in ("5000", "5001", "5002")] == ["Present", "Late", None]
+
+
+def test_dates_are_stored_canonically(server):
+    load_employees(server, 3)
+    client = TestClient(server.app)
+
+    response = client.post("/api/attendance/records", json={"date": "2026-10-5", "records": [{"emp_code": "5000", "status": "Absent"}]})
+    assert response.json()["date"] == "2026-10-05"
+    assert client.get("/api/attendance/range", params={"start": "2026-10-05", "end": "2026-10-05"}).json()["count"] == 1
+
+
+def test_reads_fall_back_to_generated_attendance_when_the_store_fails(server, monkeypatch):
+    load_employees(server, 3)
+    server.assign_attendance_slots(["5000"])
+
+    def unavailable(*args, **kwargs):
+        raise RuntimeError("MongoDB unavailable")
+
+    monkeypatch.setattr(server.attendance_days_collection, "find_one", unavailable)
+    client = TestClient(server.app)
+
+    assert client.get("/api/employees/5000/attendance").status_code == 200
+    assert server.attendance_store_failed_at > 0
+    assert not server.attendance_store_readable()
+
+
+def test_reads_see_slots_assigned_by_other_workers(server):
+    load_employees(server, 3)
+    client = TestClient(server.app)
+    records = [{"emp_code": code, "status": "Absent"} for code in ("5000", "5001", "5002")]
+    client.post("/api/attendance/records", json={"records": records})
+
+    # A worker started before the slots existed only knows what it loaded at startup
+    server.attendance_slots = {}
+    response = client.post("/api/attendance/batch", json={"emp_codes": ["5000", "5001", "5002"]})
+    assert response.json()["summary"]["Absent"] == 3
+    assert sorted(server.attendance_slots) == ["5000", "5001", "5002"]
+
+
+def test_day_cache_keeps_today_and_the_recently_used_days(server, monkeypatch):
+    load_employees(server, 3)
+    monkeypatch.setattr(server, "ATTENDANCE_DAY_CACHE_SIZE", 2)
+    client = TestClient(server.app)
+    today = server.datetime.now().strftime("%Y-%m-%d")
+
+    for date in (today, "2026-01-01", "2026-01-02", "2026-01-03"):
+        client.post("/api/attendance/records", json={"date": date, "records": [{"emp_code": "5000", "status": "Late"}]})
+    server.load_attendance_day("2026-01-02")
+    server.load_attendance_day("2026-01-04")
+
+    assert sorted(server.attendance_day_cache) == sorted([today, "2026-01-02", "2026-01-04"])
@@ -0,0 +1,85 @@
+from fastapi.testclient import TestClient
+
+
+def chart(count):
+    """Structure shaped like the HierarchyBuilder's: emp_code -> node with its manager"""
+    structure = {}
+    for index in range(count):
+        emp_code = f"E{index}"
+        structure[emp_code] = {
+            "emp_code": emp_code,
+            "emp_name": f"Employee {index}",
+            "department": "Sales",
+            "location": "IFC",
+            "designation": "Manager"
+        }
+        if index:
+            manager = f"E{(index - 1) // 3}"
+            structure[emp_code]["manager"] = manager
+            structure[emp_code]["managerName"] = f"Employee {(index - 1) // 3}"
+    return structure
+
+
+def save(client, structure):
+    response = client.post("/api/hierarchy/save", json={"id": "h1", "name": "Chart", "structure": structure})
+    assert response.status_code == 200
+    return response.json()["revision"]
+
+
+def patch(client, revision, operations):
+    response = client.patch("/api/hierarchy/h1", json={"revision": revision, "operations": operations})
+    assert response.status_code == 200, response.json()
+    return response.json()["revision"]
+
+
+def test_edits_to_a_compressed_structure_go_to_the_side_log(server):
+    client = TestClient(server.app)
+    structure = chart(300)
+    revision = save(client, structure)
+    blob = server.hierarchies_collection.find_one({"hierarchy_id": "h1"})["structure_blob"]
+    assert blob is not None
+
+    revision = patch(client, revision, [{"op": "move", "emp_code": "E200", "manager": "E1"}])
+    revision = patch(client, revision, [{"op": "remove", "emp_code": "E299"}])
+
+    doc = server.hierarchies_collection.find_one({"hierarchy_id": "h1"})
+    assert doc["structure_blob"] == blob
+    assert doc["structure_delta"]["E299"] is None
+    assert sorted(doc["structure_delta"]) == ["E200", "E299"]
+
+    served = client.get("/api/hierarchy/h1").json()["structure"]
+    assert served["E200"]["manager"] == "E1"
+    assert "E299" not in served
+    assert len(served) == 299
+
+
+def test_a_full_side_log_is_folded_into_the_blob(server, monkeypatch):
+    monkeypatch.setattr(server, "HIERARCHY_DELTA_MAX_BYTES", 1024)
+    client = TestClient(server.app)
+    revision = save(client, chart(300))
+
+    expected = chart(300)
+    for index in range(100, 110):
+        revision = patch(client, revision, [{"op": "rename", "emp_code": f"E{index}", "name": f"Renamed {index}"}])
+        expected[f"E{index}"]["label"] = f"Renamed {index}"
+
+    doc = server.hierarchies_collection.find_one({"hierarchy_id": "h1"})
+    assert 0 < len(doc.get("structure_delta", {})) < 10
+    assert server.decode_hierarchy_structure(doc) == expected
+
+
+def test_a_structure_grown_past_the_threshold_is_compressed(server, monkeypatch):
+    monkeypatch.setattr(server, "HIERARCHY_COMPRESSION_THRESHOLD", 4096)
+    client = TestClient(server.app)
+    structure = chart(20)
+    revision = save(client, structure)
+    assert "structure" in server.hierarchies_collection.find_one({"hierarchy_id": "h1"})
+
+    for index in range(20, 40):
+        node = {"emp_code": f"E{index}", "emp_name": f"Employee {index}", "department": "Sales"}
+        revision = patch(client, revision, [{"op": "add", "emp_code": f"E{index}", "manager": "E0", "node": node}])
+
+    doc = server.hierarchies_collection.find_one({"hierarchy_id": "h1"})
+    assert "structure" not in doc
+    assert doc["structure_blob"] is not None
+    assert len(server.decode_hierarchy_structure(doc)) == 40
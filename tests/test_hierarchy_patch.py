@@ -0,0 +1,97 @@
+from fastapi.testclient import TestClient
+
+
+def node(emp_code, manager=None):
+    result = {"emp_code": emp_code, "emp_name": f"Employee {emp_code}", "department": "Sales"}
+    if manager:
+        result["manager"] = manager
+        result["managerName"] = f"Employee {manager}"
+    return result
+
+
+def team():
+    """A -> B -> C, A -> D"""
+    return {"A": node("A"), "B": node("B", "A"), "C": node("C", "B"), "D": node("D", "A")}
+
+
+def save(client, structure, **fields):
+    return client.post("/api/hierarchy/save", json={"id": "h1", "name": "Team", "structure": structure, **fields})
+
+
+def patch(client, revision, *operations):
+    return client.patch("/api/hierarchy/h1", json={"revision": revision, "operations": list(operations)})
+
+
+def stored_structure(client):
+    return client.get("/api/hierarchy/h1").json()["structure"]
+
+
+def test_operations_touch_only_their_nodes(server):
+    client = TestClient(server.app)
+    save(client, team())
+
+    response = patch(
+        client, 1,
+        {"op": "move", "emp_code": "C", "manager": "D"},
+        {"op": "add", "emp_code": "E", "manager": "C", "node": node("E")},
+        {"op": "rename", "emp_code": "B", "name": "Team lead"},
+        {"op": "rename", "name": "Renamed team"}
+    )
+    assert response.json()["revision"] == 2
+    assert response.json()["changed"] == 3
+
+    structure = stored_structure(client)
+    assert structure["C"]["manager"] == "D" and structure["C"]["managerName"] == "Employee D"
+    assert structure["E"]["manager"] == "C"
+    assert structure["B"]["label"] == "Team lead"
+    assert client.get("/api/hierarchy/h1").json()["name"] == "Renamed team"
+
+    # Removing a manager detaches its reports instead of deleting them
+    response = patch(client, 2, {"op": "remove", "emp_code": "C"})
+    assert response.json()["removed"] == 1
+    structure = stored_structure(client)
+    assert "C" not in structure
+    assert "manager" not in structure["E"]
+
+
+def test_invalid_operations_are_rejected_without_writing(server):
+    client = TestClient(server.app)
+    save(client, team())
+
+    cycle = patch(client, 1, {"op": "move", "emp_code": "A", "manager": "C"})
+    assert cycle.status_code == 400
+    assert "cycle" in cycle.json()["detail"]
+    assert patch(client, 1, {"op": "move", "emp_code": "B", "manager": "B"}).status_code == 400
+    assert patch(client, 1, {"op": "move", "emp_code": "B", "manager": "Z"}).status_code == 400
+    assert patch(client, 1, {"op": "add", "emp_code": "B", "manager": "A"}).status_code == 400
+    assert patch(client, 1, {"op": "remove", "emp_code": "Z"}).status_code == 404
+    assert patch(client, 1, {"op": "move", "emp_code": "a.b"}).status_code == 400
+    assert patch(client, 1, {"op": "swap", "emp_code": "B"}).status_code == 400
+
+    # A batch fails as a whole
+    assert patch(client, 1, {"op": "move", "emp_code": "C", "manager": "D"}, {"op": "move", "emp_code": "A", "manager": "C"}).status_code == 400
+    assert stored_structure(client) == team()
+    assert client.get("/api/hierarchy/h1").json()["revision"] == 1
+
+
+def test_stale_revisions_conflict(server):
+    client = TestClient(server.app)
+    save(client, team())
+    assert patch(client, 1, {"op": "move", "emp_code": "C", "manager": "D"}).status_code == 200
+
+    assert patch(client, 1, {"op": "move", "emp_code": "C", "manager": "A"}).status_code == 409
+    assert save(client, team(), revision=1).status_code == 409
+    assert save(client, team(), revision=2).json()["revision"] == 3
+    assert stored_structure(client)["C"]["manager"] == "B"
+
+
+def test_documents_saved_before_revisions_can_be_patched(server):
+    server.hierarchies_collection.insert_one({"hierarchy_id": "h1", "name": "Team", "structure": team()})
+    client = TestClient(server.app)
+
+    assert patch(client, 1, {"op": "remove", "emp_code": "D"}).status_code == 409
+    response = patch(client, 0, {"op": "remove", "emp_code": "D"})
+    assert response.status_code == 200
+    assert response.json()["revision"] == 1
+    assert "D" not in stored_structure(client)
+
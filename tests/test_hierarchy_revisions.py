@@ -0,0 +1,50 @@
+import copy
+
+from fastapi.testclient import TestClient
+
+
+def test_checkout_across_snapshot_boundaries(server, monkeypatch):
+    monkeypatch.setattr(server, "HIERARCHY_SNAPSHOT_INTERVAL", 3)
+    client = TestClient(server.app)
+    structure = {"A": {"emp_code": "A", "emp_name": "Employee A"}}
+    client.post("/api/hierarchy/save", json={"id": "h1", "name": "Team", "structure": structure})
+
+    expected = {1: copy.deepcopy(structure)}
+    revision = 1
+    for step in range(1, 9):
+        if step % 4 == 0:
+            operation = {"op": "remove", "emp_code": f"N{step - 1}"}
+            del structure[f"N{step - 1}"]
+        else:
+            added = {"emp_code": f"N{step}", "emp_name": f"Employee N{step}"}
+            operation = {"op": "add", "emp_code": f"N{step}", "manager": "A", "node": added}
+            structure[f"N{step}"] = {**added, "manager": "A", "managerName": "Employee A"}
+        response = client.patch("/api/hierarchy/h1", json={"revision": revision, "operations": [operation]})
+        revision = response.json()["revision"]
+        expected[revision] = copy.deepcopy(structure)
+    assert revision == 9
+
+    kinds = {entry["revision"]: entry["kind"] for entry in client.get("/api/hierarchy/h1/revisions").json()["revisions"]}
+    assert [revision for revision, kind in sorted(kinds.items()) if kind == "snapshot"] == [1, 4, 7]
+
+    for revision, structure in expected.items():
+        checkout = client.get(f"/api/hierarchy/h1/revisions/{revision}").json()
+        assert checkout["revision"] == revision
+        assert checkout["structure"] == structure
+    assert client.get("/api/hierarchy/h1/revisions/10").status_code == 404
+
+
+def test_full_saves_are_recorded_as_diffs(server):
+    client = TestClient(server.app)
+    structure = {code: {"emp_code": code, "emp_name": f"Employee {code}"} for code in "ABCD"}
+    client.post("/api/hierarchy/save", json={"id": "h1", "name": "Team", "structure": structure})
+
+    edited = copy.deepcopy(structure)
+    edited["B"]["manager"] = "A"
+    del edited["D"]
+    client.post("/api/hierarchy/save", json={"id": "h1", "name": "Team", "structure": edited, "revision": 1})
+
+    latest = client.get("/api/hierarchy/h1/revisions").json()["revisions"][0]
+    assert (latest["revision"], latest["kind"], latest["changed_count"], latest["removed_count"]) == (2, "diff", 1, 1)
+    assert client.get("/api/hierarchy/h1/revisions/1").json()["structure"] == structure
+    assert client.get("/api/hierarchy/h1/revisions/2").json()["structure"] == edited
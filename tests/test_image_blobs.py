@@ -0,0 +1,207 @@
+import base64
+import hashlib
+import io
+import time
+import zipfile
+from collections import Counter
+
+from fastapi.testclient import TestClient
+from PIL import Image
+from pymongo.errors import BulkWriteError
+
+from tests.helpers import make_employee
+
+
+def png_bytes(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (5, 5), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def blob_refs(server):
+    """hash -> reference count of every stored blob"""
+    return {blob["_id"]: blob["refs"] for blob in server.image_blobs_collection.find()}
+
+
+def upload(client, emp_code, content):
+    return client.post(f"/api/employees/{emp_code}/image", files={"file": ("photo.png", content, "image/png")})
+
+
+def test_identical_photos_share_one_blob(server):
+    server.set_employees_data([make_employee(code) for code in (1, 2, 3)])
+    client = TestClient(server.app)
+    red, blue = png_bytes("red"), png_bytes("blue")
+    red_hash, blue_hash = hashlib.sha256(red).hexdigest(), hashlib.sha256(blue).hexdigest()
+
+    for emp_code in ("1", "2", "3"):
+        assert upload(client, emp_code, red).status_code == 200
+    assert blob_refs(server) == {red_hash: 3}
+
+    # Replacing a photo moves the reference; deleting one drops it
+    upload(client, "1", blue)
+    assert blob_refs(server) == {red_hash: 2, blue_hash: 1}
+    assert client.delete("/api/employees/2/image").status_code == 200
+    assert blob_refs(server) == {red_hash: 1, blue_hash: 1}
+
+    # The last reference takes the blob with it
+    client.delete("/api/employees/3/image")
+    assert blob_refs(server) == {blue_hash: 1}
+    assert client.delete("/api/employees/3/image").status_code == 404
+
+
+def test_reuploading_the_same_photo_keeps_one_reference(server):
+    server.set_employees_data([make_employee(1)])
+    client = TestClient(server.app)
+    red = png_bytes("red")
+
+    upload(client, "1", red)
+    upload(client, "1", red)
+    assert blob_refs(server) == {hashlib.sha256(red).hexdigest(): 1}
+
+
+def assert_refs_match_documents(server):
+    """Every blob is referenced exactly by the image documents pointing at it"""
+    expected = Counter(doc["image_hash"] for doc in server.images_collection.find())
+    assert blob_refs(server) == dict(expected)
+
+
+def encoded_png(color):
+    return base64.b64encode(png_bytes(color)).decode()
+
+
+def test_failed_writes_release_their_references(server, monkeypatch):
+    red, blue = encoded_png("red"), encoded_png("blue")
+    server.save_employee_images_to_db([("1", red, "image/png")])
+
+    bulk_write = server.images_collection.bulk_write
+
+    def failing_for_employee_2(operations, ordered=True):
+        # The server rejects employee 2's write and applies the rest, as an unordered bulk_write does
+        failed = [index for index, operation in enumerate(operations) if operation._filter["emp_code"] == "2"]
+        kept = [index for index in range(len(operations)) if index not in failed]
+        result = bulk_write([operations[index] for index in kept], ordered=ordered).bulk_api_result
+        details = {
+            **result,
+            "upserted": [{**upsert, "index": kept[upsert["index"]]} for upsert in result["upserted"]],
+            "writeErrors": [{"index": index, "errmsg": "write failed"} for index in failed]
+        }
+        raise BulkWriteError(details)
+
+    monkeypatch.setattr(server.images_collection, "bulk_write", failing_for_employee_2)
+    errors = server.save_employee_images_to_db([("1", blue, "image/png"), ("2", red, "image/png")])
+
+    assert errors == {"1": None, "2": "write failed"}
+    assert blob_refs(server) == {server.image_content_hash(blue): 1}
+    assert server.images_collection.count_documents({}) == 1
+
+
+def test_imports_are_written_with_one_bulk_write(server, monkeypatch):
+    bulk_write = server.images_collection.bulk_write
+    calls = []
+
+    def counting_bulk_write(operations, ordered=True):
+        calls.append(len(operations))
+        return bulk_write(operations, ordered=ordered)
+
+    monkeypatch.setattr(server.images_collection, "bulk_write", counting_bulk_write)
+    server.save_employee_images_to_db([("1", encoded_png("red"), "image/png")])
+    server.save_employee_images_to_db([(str(code), encoded_png("blue"), "image/png") for code in range(1, 30)])
+
+    assert calls == [1, 29]
+    assert_refs_match_documents(server)
+
+
+def test_writes_that_lose_a_race_are_retried(server, monkeypatch):
+    colors = {"1": "red", "2": "blue", "3": "green"}
+    server.save_employee_images_to_db([(code, encoded_png(color), "image/png") for code, color in colors.items()])
+
+    bulk_write = server.images_collection.bulk_write
+    calls = []
+
+    def racing_bulk_write(operations, ordered=True):
+        calls.append(len(operations))
+        first = len(calls) == 1
+        if first:
+            # Another writer replaces employee 2 between our read and our write...
+            server.save_employee_images_to_db([("2", encoded_png("yellow"), "image/png")])
+        result = bulk_write(operations, ordered=ordered)
+        if first:
+            # ...and employee 1 right after our write landed, releasing our photo itself
+            server.save_employee_images_to_db([("1", encoded_png("white"), "image/png")])
+        return result
+
+    monkeypatch.setattr(server.images_collection, "bulk_write", racing_bulk_write)
+    errors = server.save_employee_images_to_db([(code, encoded_png("black"), "image/png") for code in ("1", "2", "3")])
+
+    assert errors == {"1": None, "2": None, "3": None}
+    # Ours, the two concurrent writers, then employee 2 again: employee 1's write was applied
+    assert calls == [3, 1, 1, 1]
+    hashes = server.get_employee_image_hashes(["1", "2", "3"])
+    assert hashes["1"] == server.image_content_hash(encoded_png("white"))
+    assert hashes["2"] == hashes["3"] == server.image_content_hash(encoded_png("black"))
+    assert_refs_match_documents(server)
+
+
+def test_inline_images_are_migrated_to_blobs(server):
+    red = base64.b64encode(png_bytes("red")).decode()
+    for emp_code in ("1", "2"):
+        server.images_collection.insert_one({"emp_code": emp_code, "image_data": red, "image_type": "image/png"})
+
+    server.migrate_inline_images()
+    server.migrate_inline_images()
+
+    image_hash = server.image_content_hash(red)
+    assert blob_refs(server) == {image_hash: 2}
+    assert server.images_collection.count_documents({"image_data": {"$exists": True}}) == 0
+    assert server.get_employee_images_from_db(["1", "2"]) == {
+        "1": server.image_data_url("image/png", red),
+        "2": server.image_data_url("image/png", red)
+    }
+
+
+def test_blob_endpoint_is_immutable_and_conditional(server):
+    server.set_employees_data([make_employee(1), make_employee(2)])
+    client = TestClient(server.app)
+    red = png_bytes("red")
+    upload(client, "1", red)
+
+    employees = client.post("/api/employees/batch", json={"emp_codes": ["1", "2"]}).json()["employees"]
+    image_ref = employees[0]["image_ref"]
+    assert image_ref == f"/api/images/{hashlib.sha256(red).hexdigest()}"
+    assert "image_ref" not in employees[1]
+
+    response = client.get(image_ref)
+    assert response.status_code == 200
+    assert response.content == red
+    assert response.headers["cache-control"] == server.IMAGE_BLOB_CACHE_CONTROL
+
+    revalidated = client.get(image_ref, headers={"If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert client.get("/api/images/not-a-hash").status_code == 404
+    assert client.get("/api/images/" + "0" * 64).status_code == 404
+
+
+def test_zip_import_reports_progress_from_mongodb(server):
+    server.set_employees_data([make_employee(code) for code in (1, 2)])
+    client = TestClient(server.app)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zipped:
+        zipped.writestr("1.png", png_bytes("red"))
+        zipped.writestr("2.png", png_bytes("red"))
+        zipped.writestr("3.png", png_bytes("blue"))
+        zipped.writestr("notes.png", b"not an image")
+
+    status_url = client.post(
+        "/api/employees/images/import", files={"file": ("photos.zip", archive.getvalue(), "application/zip")}
+    ).json()["status_url"]
+    deadline = time.time() + 10
+    while (job := client.get(status_url).json())["state"] not in ("finished", "failed") and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert job["state"] == "finished"
+    assert job["counts"] == {"imported": 2, "skipped": 2, "error": 0}
+    assert [result["file"] for result in job["results"]] == ["1.png", "2.png", "3.png", "notes.png"]
+    assert blob_refs(server) == {hashlib.sha256(png_bytes("red")).hexdigest(): 2}
+    # Kept in MongoDB until the TTL indexes drop them
+    assert server.image_import_jobs_collection.find_one({"job_id": job["job_id"]})["expire_at"] > server.datetime.utcnow()
+    assert client.get("/api/employees/images/import/unknown").status_code == 404
@@ -0,0 +1,60 @@
+import random
+
+from tests.helpers import make_employee
+
+
+def naive_common_manager(parent, a, b):
+    """First shared ancestor (including the rows themselves) by walking ancestor sets"""
+    ancestors = set()
+    node = a
+    while node != -1:
+        ancestors.add(node)
+        node = parent[node]
+    node = b
+    while node != -1:
+        if node in ancestors:
+            return node
+        node = parent[node]
+    return -1
+
+
+def test_lowest_common_manager_matches_naive_walk(server):
+    rng = random.Random(35)
+    employees = [make_employee(1000)]
+    for index in range(1, 3000):
+        # A few extra roots so pairs from different trees are covered too
+        manager = "" if rng.random() < 0.01 else 1000 + rng.randrange(index)
+        employees.append(make_employee(1000 + index, manager))
+    server.set_employees_data(employees)
+
+    for _ in range(5000):
+        a = rng.randrange(len(employees))
+        b = rng.randrange(len(employees))
+        expected = naive_common_manager(server.org_parent, a, b)
+        assert server.lowest_common_manager(a, b) == expected
+
+        result = server.common_manager_result(a, b)
+        if expected == -1:
+            assert result["common_manager_code"] is None
+        else:
+            assert result["common_manager_code"] == employees[expected]["emp_code"]
+            assert result["distance"] == server.org_depth[a] + server.org_depth[b] - 2 * server.org_depth[expected]
+
+
+def test_deep_chain_needs_no_recursion(server):
+    depth = 10000
+    employees = [make_employee(1)] + [make_employee(index + 1, index) for index in range(1, depth)]
+    server.set_employees_data(employees)
+
+    assert server.org_depth[depth - 1] == depth - 1
+    assert server.lowest_common_manager(depth - 1, depth // 2) == depth // 2
+    assert server.org_tout[0] - server.org_tin[0] == depth
+
+
+def test_cycles_are_cut_and_reported(server):
+    employees = [make_employee(1, 3), make_employee(2, 1), make_employee(3, 2), make_employee(4, 9)]
+    server.set_employees_data(employees)
+
+    assert len(server.reporting_validation["cycles"]) == 1
+    assert server.reporting_validation["orphans"] == [{"emp_code": "4", "reporting_id": "9"}]
+    assert server.lowest_common_manager(0, 2) != -1
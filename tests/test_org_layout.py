@@ -0,0 +1,69 @@
+import random
+
+
+def random_tree(rng, count):
+    """Ordered child lists of a random tree rooted at 0"""
+    children = [[] for _ in range(count)]
+    for node in range(1, count):
+        # Favour recent nodes so the trees get deep as well as wide
+        children[rng.randrange(max(0, node - 20), node)].append(node)
+    return children
+
+
+def levels(children, root):
+    """Nodes of every depth, left to right"""
+    result = []
+    level = [root]
+    while level:
+        result.append(level)
+        level = [child for node in level for child in children[node]]
+    return result
+
+
+def assert_tidy(children, root, x):
+    for node in range(len(children)):
+        if children[node]:
+            # A parent is centred over its first and last child
+            assert abs(x[node] - (x[children[node][0]] + x[children[node][-1]]) / 2) < 1e-9
+
+    for level in levels(children, root):
+        # Left-to-right order is preserved and neighbours are at least one unit apart
+        for left, right in zip(level, level[1:]):
+            assert x[right] - x[left] >= 1 - 1e-9
+
+
+def test_tidy_layout_on_random_trees(server):
+    rng = random.Random(37)
+    for count in (1, 2, 10, 200, 2000):
+        children = random_tree(rng, count)
+        assert_tidy(children, 0, server.tidy_tree_layout(children, 0))
+
+
+def test_tidy_layout_is_symmetric_for_mirrored_trees(server):
+    children = [[1, 2, 3], [4, 5], [], [6, 7, 8], [], [], [], [], []]
+    x = server.tidy_tree_layout(children, 0)
+    mirrored = [list(reversed(kids)) for kids in children]
+    mirrored_x = server.tidy_tree_layout(mirrored, 0)
+
+    for node in range(len(children)):
+        assert abs((x[node] - x[0]) + (mirrored_x[node] - mirrored_x[0])) < 1e-9
+
+
+def test_tidy_layout_handles_deep_chains(server):
+    depth = 20000
+    children = [[node + 1] for node in range(depth - 1)] + [[]]
+    x = server.tidy_tree_layout(children, 0)
+    assert max(x) - min(x) < 1e-9
+
+
+def test_forest_layout_payload(server):
+    codes = ["a", "b", "c", "d", "e"]
+    children = [[1, 2], [], [], [4], []]
+    payload = server.layout_payload(codes, codes, children, [0, 3])
+
+    nodes = {node["emp_code"]: node for node in payload["nodes"]}
+    assert nodes["a"]["parent"] is None and nodes["d"]["parent"] is None
+    assert nodes["b"]["parent"] == "a" and nodes["e"]["y"] == 1
+    assert min(node["x"] for node in payload["nodes"]) == 0
+    assert nodes["d"]["x"] - nodes["a"]["x"] >= 1
+    assert payload["height"] == 1
@@ -0,0 +1,26 @@
+from fastapi.testclient import TestClient
+
+from tests.helpers import make_employee
+
+
+def test_queries_that_normalize_to_nothing_list_everyone(server):
+    server.set_employees_data([make_employee(code) for code in (1, 2, 3)])
+    client = TestClient(server.app)
+
+    assert server.score_search_matches("") == {}
+    for q in ("\x1f", "\x1f\x1f"):
+        response = client.get("/api/employees/search", params={"q": q})
+        assert response.status_code == 200
+        assert len(response.json()["employees"]) == 3
+
+
+def test_global_search_ranks_exact_matches_first(server):
+    server.set_employees_data([
+        make_employee(1, emp_name="Anna Smith"),
+        make_employee(2, emp_name="Anna"),
+        make_employee(3, emp_name="Hannah")
+    ])
+    client = TestClient(server.app)
+
+    employees = client.get("/api/employees/search", params={"q": "ANNA"}).json()["employees"]
+    assert [emp["emp_code"] for emp in employees] == ["2", "1", "3"]